@@ -2,8 +2,26 @@ import math
 import textwrap
 import shelve
 import datetime
-
-import libtcodpy as libtcod
+import collections
+import heapq
+import os
+from array import array
+
+try:  #NumPy is optional, with it the map background is filled in one go
+    import numpy
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+#the console backend: libtcod opens a window, the headless one keeps everything in memory
+#and takes scripted input, for running the game without a display, and ansi draws it in a terminal
+BACKEND = os.environ.get('ZOMBIES_BACKEND', 'libtcod')
+if BACKEND == 'headless':
+    import headless as libtcod
+elif BACKEND == 'ansi':
+    import ansi as libtcod
+else:
+    import libtcodpy as libtcod
 
 #=====#
 #Setup#
@@ -12,7 +30,8 @@ import libtcodpy as libtcod
 #Screen
 SCREEN_WIDTH = 80
 SCREEN_HEIGHT = 50
-LIMIT_FPS = 10
+LIMIT_FPS = 10  #frame cap while something is animating (fire)
+IDLE_WAIT_MS = 10  #how long to wait between input checks when nothing is happening
 LEVEL_SCREEN_WIDTH = 40
 CHARACTER_SCREEN_WIDTH = 30
 
@@ -22,6 +41,10 @@ MAP_HEIGHT = 43
 ROOM_MAX_SIZE = 10
 ROOM_MIN_SIZE = 6
 MAX_ROOMS = 30
+
+#Camera: the window onto the map shown above the panel (the map can be bigger than that)
+CAMERA_WIDTH = 80
+CAMERA_HEIGHT = 43
 MAX_ROOM_MONSTERS = 3 
 MAX_ROOM_ITEMS = 2
 
@@ -36,8 +59,17 @@ color_light_wall = libtcod.Color(130, 110, 50)
 color_dark_ground = libtcod.Color(50, 50, 150)
 color_light_ground = libtcod.Color(200, 180, 50)
 
-#game font
-libtcod.console_set_custom_font('arial10x10.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
+#targeting colors
+color_target_range = libtcod.Color(0, 40, 0)  #added on top of the tiles that are in range
+color_target_ok = libtcod.light_green
+color_target_bad = libtcod.dark_red
+
+#render layers, drawn from the bottom up
+LAYER_FLOOR = 0   #stairs, corpses
+LAYER_ITEM = 1
+LAYER_ACTOR = 2
+LAYER_EFFECT = 3  #fire
+LAYER_PLAYER = 4
 
 #sizes and coordinates relevant for the GUI
 BAR_WIDTH = 20
@@ -46,6 +78,7 @@ PANEL_Y = SCREEN_HEIGHT - PANEL_HEIGHT
 MSG_X = BAR_WIDTH + 2
 MSG_WIDTH = SCREEN_WIDTH - BAR_WIDTH - 2
 MSG_HEIGHT = PANEL_HEIGHT - 1
+MSG_HISTORY = 2000  #messages kept for scrolling back
 INVENTORY_WIDTH = 50
 
 #==========#
@@ -61,6 +94,7 @@ WILD_SHOT_RANGE = 5
 
 GERNADE_RADIUS = 3
 GERNADE_DAMAGE = 12
+GERNADE_FUSE = 6  #ticks from the throw to the bang: half a turn (anything faster than the player may get a move in first)
 
 #============#
 #Player stats#
@@ -70,16 +104,107 @@ GERNADE_DAMAGE = 12
 LEVEL_UP_BASE = 200
 LEVEL_UP_FACTOR = 150
 
+#============#
+#Entity Store#
+#============#
+
+class EntityStore:
+    #the per-entity numbers (position, glyph, colour and combat stats) kept in
+    #typed columns indexed by entity id. Object and Fighter are thin views onto
+    #one row, so there is no per-entity dict holding these values.
+    COLUMNS = ('x', 'y', 'char', 'color', 'hp', 'max_hp', 'defense', 'power', 'xp')
+
+    def __init__(self):
+        for name in self.COLUMNS:
+            setattr(self, name, array('i'))
+        self.free_ids = []
+
+    def new_entity(self):
+        #reuse a released row if there is one, otherwise grow every column by one
+        if self.free_ids:
+            id = self.free_ids.pop()
+            for name in self.COLUMNS:
+                getattr(self, name)[id] = 0
+        else:
+            id = len(self.x)
+            for name in self.COLUMNS:
+                getattr(self, name).append(0)
+        return id
+
+    def release(self, id):
+        self.free_ids.append(id)
+
+def entity_column(name):
+    #a property reading and writing this entity's row in one of the store's columns
+    def get(self):
+        return getattr(entities, name)[self.id]
+    def set(self, value):
+        getattr(entities, name)[self.id] = value
+    return property(get, set)
+
+#=======#
+#Palette#
+#=======#
+
+#colours are stored packed as 0xRRGGBB, and each packed value maps back to one shared Color.
+#the renderer only ever hands these shared Colors (and the precomputed shades below) to the
+#console, so it never builds a Color, or goes through Color's native arithmetic, per tile
+palette = {}
+
+def pack_color(color):
+    value = libtcod.col_to_int(color)
+    if value not in palette:
+        palette[value] = libtcod.Color(color.r, color.g, color.b)
+    return value
+
+def palette_color(value):
+    #the shared Color for a packed value (made on first use, e.g. after loading a saved game)
+    color = palette.get(value)
+    if color is None:
+        color = palette[value] = libtcod.Color((value >> 16) & 0xff, (value >> 8) & 0xff, value & 0xff)
+    return color
+
+def add_colors(color, other):
+    #color + other, clamped like BKGND_ADD, worked out on the packed values
+    (a, b) = (pack_color(color), pack_color(other))
+    value = 0
+    for shift in (16, 8, 0):
+        value |= min(255, ((a >> shift) & 0xff) + ((b >> shift) & 0xff)) << shift
+    return palette_color(value)
+
+#background colour for each tile state: unexplored, dark ground, dark wall, light ground, light wall
+tile_colors = tuple(palette_color(pack_color(color)) for color in
+    (libtcod.black, color_dark_ground, color_dark_wall, color_light_ground, color_light_wall))
+
+#the same with the targeting tint added, for tiles that are in range
+target_tile_colors = tuple(add_colors(color, color_target_range) for color in tile_colors)
+
 #============#
 #Object Class#
 #============#
 
-class Object:
+class Object(object):
 
     #this is a generic object: the player, a monster, an item, the stairs...
     #it's always represented by a character on screen.
-    def __init__(self, x, y, char, name, color, blocks=False, always_visible=False, fighter=None, ai=None, item=None, flame=None):
+    x = entity_column('x')
+    y = entity_column('y')
+
+    def get_char(self):
+        return chr(entities.char[self.id])
+    def set_char(self, char):
+        entities.char[self.id] = ord(char)
+    char = property(get_char, set_char)
+
+    def get_color(self):
+        return palette_color(entities.color[self.id])
+    def set_color(self, color):
+        entities.color[self.id] = pack_color(color)
+    color = property(get_color, set_color)
+
+    def __init__(self, x, y, char, name, color, blocks=False, always_visible=False, fighter=None, ai=None, item=None, layer=None):
    
+        self.id = entities.new_entity()
         self.x = x
         self.y = y
         self.char = char
@@ -88,13 +213,9 @@ class Object:
         self.blocks = blocks
         self.always_visible = always_visible  
 		
-        self.flame =flame
-        if self.flame:
-            self.flame.owner = self
-            
         self.fighter = fighter
-        if self.fighter:  #let the fighter component know who owns it
-            self.fighter.owner = self
+        if self.fighter:  #let the fighter component know who owns it, and move its stats into the store
+            self.fighter.attach(self)
  
         self.ai = ai
         if self.ai:  #let the AI component know who owns it
@@ -103,12 +224,24 @@ class Object:
         self.item = item
         if self.item:  #let the Item component know who owns it
             self.item.owner = self
+
+        #unless told otherwise, fighters are drawn over items, and items over everything else
+        if layer is None:
+            if self.fighter:
+                layer = LAYER_ACTOR
+            elif self.item:
+                layer = LAYER_ITEM
+            else:
+                layer = LAYER_FLOOR
+        self.layer = layer
     
 	#move by the given amount, if the destination is not blocked
     def move(self, dx, dy):
-        if not map[self.x + dx][self.y + dy].blocked or dx==0 and dy==0:
+        if not map.blocked_at(self.x + dx, self.y + dy) or dx==0 and dy==0:
+            vacate(self)
             self.x += dx
             self.y += dy
+            occupy(self)
  
     #vector from this object to the target, and distance
     def move_towards(self, target_x, target_y):
@@ -181,42 +314,260 @@ class Object:
 	#return the distance to some coordinates
     def distance(self, x, y):
         return math.sqrt((x - self.x) ** 2 + (y - self.y) ** 2)
+
+	#return the squared distance to another object (cheaper, for comparisons)
+    def distance_squared_to(self, other):
+        dx = other.x - self.x
+        dy = other.y - self.y
+        return dx * dx + dy * dy
 		
-    def draw(self):
+    def is_visible(self):
         #only show if it's visible to the player
-        if (libtcod.map_is_in_fov(fov_map, self.x, self.y) or
-            (self.always_visible and map[self.x][self.y].explored)):
-            #set the color and then draw the character that represents this object at its position
-            libtcod.console_set_foreground_color(con, self.color)
-            libtcod.console_put_char(con, self.x, self.y, self.char, libtcod.BKGND_NONE)
+        return ((self.x, self.y) in visible_tiles or
+            (self.always_visible and map.explored_at(self.x, self.y)))
     
-	#make this object be drawn first, so all others appear above it if they're in the same tile.
-    def send_to_back(self):
-        global objects
-        objects.remove(self)
-        objects.insert(0, self)
+    #move this object to another render layer (e.g. a monster becoming a corpse on the floor)
+    def set_layer(self, layer):
+        self.layer = layer
 		
-    #erase the character that represents this object
-    def clear(self):
-        libtcod.console_put_char(con, self.x, self.y, ' ', libtcod.BKGND_NONE)
- 
+    #the object is gone for good (used up, burnt out), so its row in the store can be reused
+    def destroy(self):
+        entities.release(self.id)
+ 
+#===============#
+#Occupancy Index#
+#===============#
+
+#every object on the map is also filed under the tile it stands on, so asking
+#"what is on this tile?" doesn't mean walking the whole objects list
+def reset_occupancy():
+    global occupancy
+    occupancy = {}
+
+def rebuild_indexes():
+    #refill the occupancy index, landmarks and turn order from the objects list (e.g. after loading a game)
+    reset_occupancy()
+    reset_layers()
+    reset_turn_order()
+    for object in objects:
+        occupy(object)
+        add_landmark(object)
+        register(object)
+
+def occupy(object):
+    occupancy.setdefault((object.x, object.y), []).append(object)
+
+def vacate(object):
+    tile = occupancy[(object.x, object.y)]
+    tile.remove(object)
+    if not tile:
+        del occupancy[(object.x, object.y)]
+
+def objects_at(x, y):
+    #all objects standing on the given tile
+    return occupancy.get((x, y), [])
+
+#===============#
+#Spatial Queries#
+#===============#
+
+#tile offsets within each radius, nearest first. worked out once per radius
+disc_masks = {}
+
+def disc(radius):
+    #the (dx, dy, squared distance) of every tile within radius of a centre tile
+    if radius not in disc_masks:
+        offsets = []
+        for dy in range(-radius, radius + 1):
+            for dx in range(-radius, radius + 1):
+                if dx * dx + dy * dy <= radius * radius:
+                    offsets.append((dx, dy, dx * dx + dy * dy))
+        offsets.sort(key=lambda offset: offset[2])
+        disc_masks[radius] = offsets
+    return disc_masks[radius]
+
+def fighters_within(x, y, radius):
+    #every fighter within radius of (x, y), nearest first
+    found = []
+    for (dx, dy, dist) in disc(radius):
+        for object in objects_at(x + dx, y + dy):
+            if object.fighter:
+                found.append(object)
+    return found
+
+def nearest_hostile(x, y, max_range):
+    #the nearest monster within range of (x, y) that the player can see, or None.
+    #anything less than max_range + 1 away counts as in range
+    reach = (max_range + 1) * (max_range + 1)
+    for (dx, dy, dist) in disc(max_range + 1):
+        if dist >= reach:
+            break  #the disc is sorted nearest first
+        for object in objects_at(x + dx, y + dy):
+            if object.fighter and object != player and libtcod.map_is_in_fov(fov_map, object.x, object.y):
+                return object
+    return None
+
+def add_object(object):
+    #put an object on the map
+    objects.append(object)
+    occupy(object)
+    add_landmark(object)
+    register(object)
+
+def remove_object(object):
+    #take an object off the map
+    objects.remove(object)
+    vacate(object)
+    remove_landmark(object)
+    unregister(object)
+
+#=============#
+#Render Layers#
+#=============#
+
+#each object has a render layer, and on a tile the object on the highest layer is the one drawn,
+#so the draw order doesn't depend on the order of the objects list.
+#objects that stay on screen once seen (the stairs, items) are also kept as landmarks,
+#filed by the LANDMARK_CHUNK-sized square of the map they are in
+LANDMARK_CHUNK = 16
+
+def reset_layers():
+    global landmarks
+    landmarks = {}
+
+def landmark_chunk(x, y):
+    return (x // LANDMARK_CHUNK, y // LANDMARK_CHUNK)
+
+def add_landmark(object):
+    if object.always_visible:
+        landmarks.setdefault(landmark_chunk(object.x, object.y), set()).add(object)
+
+def remove_landmark(object):
+    landmarks.get(landmark_chunk(object.x, object.y), set()).discard(object)
+
+def landmarks_on_screen():
+    (x1, y1) = landmark_chunk(camera_x, camera_y)
+    (x2, y2) = landmark_chunk(camera_x + CAMERA_WIDTH - 1, camera_y + CAMERA_HEIGHT - 1)
+    for cy in range(y1, y2 + 1):
+        for cx in range(x1, x2 + 1):
+            for object in landmarks.get((cx, cy), ()):
+                yield object
+
+def visible_glyphs():
+    #the character and colour to show on each map tile the player can see something on.
+    #only the tiles in view and the landmarks under the camera are looked at,
+    #so the cost doesn't grow with the size of the level or the number of objects on it
+    glyphs = {}
+    drawn_layer = {}
+    def show(x, y, layer, glyph):
+        if layer >= drawn_layer.get((x, y), -1) and on_screen(x, y):
+            drawn_layer[(x, y)] = layer
+            glyphs[(x, y)] = glyph
+
+    for object in landmarks_on_screen():
+        if object.is_visible():
+            show(object.x, object.y, object.layer, (object.char, object.color))
+    for (x, y) in visible_tiles:
+        for object in objects_at(x, y):
+            show(x, y, object.layer, (object.char, object.color))
+        if fire.is_burning(x, y):
+            #flames flicker from frame to frame
+            show(x, y, LAYER_EFFECT, (',', FLAME_COLORS[(x + y + animation_frame) % len(FLAME_COLORS)]))
+    return glyphs
+
+#==============#
+#Turn Scheduler#
+#==============#
+
+#game time goes by in ticks, and whoever acts next waits as many ticks as they are slow:
+#the player and an ordinary zombie act every TURN ticks, a fast zombie more often and a
+#slow one less. everything waiting to happen (the monsters that are awake, the fire, a
+#gernade about to go off) sits in one heap ordered by when it's due, so a player's action
+#only touches what falls due before their next one
+
+TURN = 12
+
+class Scheduler:
+    def __init__(self):
+        self.now = 0
+        self.queue = []
+        self.count = 0  #so things due on the same tick go in the order they were scheduled
+
+    def schedule(self, delay, action):
+        #call action() delay ticks from now. it returns the ticks until it should be called
+        #again, or None if it's done
+        self.count += 1
+        heapq.heappush(self.queue, (self.now + delay, self.count, action))
+
+    def run(self, ticks):
+        #let some ticks go by, doing everything that falls due on the way, in order
+        end = self.now + ticks
+        while self.queue and self.queue[0][0] <= end:
+            (self.now, count, action) = heapq.heappop(self.queue)
+            delay = action()
+            if delay is not None:
+                self.schedule(delay, action)
+        self.now = end
+
+def reset_turn_order():
+    global turns, last_wake_check
+    turns = Scheduler()  #only the monsters that are awake are in it, see AI Scheduling
+    last_wake_check = None
+
+def register(object):
+    if object.ai and object.ai.awake:
+        turns.schedule(object.ai.speed, object.ai.act)
+
+def unregister(object):
+    #a monster that is taken off the map is dropped from the turn order when its turn comes up
+    if object.ai:
+        object.ai.awake = False
+
+#=============#
+#AI Scheduling#
+#=============#
+
+#a monster only acts while the player can see it or it can hear something (see Noise).
+#the ones that can't are asleep: they are left out of the turn order and cost nothing.
+#a sleeping monster doesn't move, so only the player's view reaching it or a change in the
+#noise map can wake it, and those are the only times anything is checked
+
+def wake(object):
+    if not object.ai.awake:
+        object.ai.awake = True
+        turns.schedule(object.ai.speed, object.ai.act)
+
+def fall_asleep(object):
+    #it's dropped from the turn order once this turn is over
+    object.ai.awake = False
+
+def wake_in_view(tiles):
+    #the player can now see these tiles: wake anything on them
+    for (x, y) in tiles:
+        for object in objects_at(x, y):
+            if object.ai:
+                wake(object)
+
+def wake_within_earshot():
+    #wake everything that can hear a noise, but only look again once the noise map has changed
+    global last_wake_check
+    field = noise_field()
+    if last_wake_check == field.source:
+        return
+    last_wake_check = field.source
+    width = field.tiles.width
+    for i in field.heard:
+        for object in objects_at(i % width, i // width):
+            if object.ai:
+                wake(object)
+
 #===============================#
 #Object Functions and SubClasses#
 #===============================#
 
 def closest_monster(max_range):
     #find closest enemy, up to a maximum range, and in the player's FOV
-    closest_enemy = None
-    closest_dist = max_range + 1  #start with (slightly more than) maximum range
- 
-    for object in objects:
-        if object.fighter and not object == player and libtcod.map_is_in_fov(fov_map, object.x, object.y):
-            #calculate distance between this object and the player
-            dist = player.distance_to(object)
-            if dist < closest_dist:  #it's closer, so remember it
-                closest_enemy = object
-                closest_dist = dist
-    return closest_enemy
+    return nearest_hostile(player.x, player.y, max_range)
 
 def target_monster(max_range=None):
     #returns a clicked monster inside FOV up to a range, or None if right-clicked
@@ -226,53 +577,111 @@ def target_monster(max_range=None):
             return None
  
         #return the first clicked monster, otherwise continue looping
-        for obj in objects:
-            if obj.x == x and obj.y == y and obj.fighter and obj != player:
+        for obj in objects_at(x, y):
+            if obj.fighter and obj != player:
                 return obj	
 
-class Flame:
-    def __init__(self, duration, heat, spread):
-        self.max_duration = duration
-        self.duration = duration
-        self.heat = heat
-        self.spread = spread
-        
+FLAME_COLORS = tuple(palette_color(pack_color(color)) for color in (libtcod.red, libtcod.orange, libtcod.red, libtcod.yellow))
+
+class Fire:
+    #all the fire on the level, kept like the TileMap as flat planes (heat, turns
+    #left to burn and how far it can spread) plus the set of tiles that are burning.
+    #a flame spreading onto a tile that is already alight merges with it instead of
+    #stacking another flame there.
+    def __init__(self, width, height):
+        self.width = width
+        size = width * height
+        self.heat = bytearray(size)
+        self.duration = bytearray(size)
+        self.spread = bytearray(size)
+        self.burning = set()
+        self.scheduled = False
+
+    def ignite(self, x, y, duration, heat, spread):
+        i = x + y * self.width
+        self.duration[i] = max(self.duration[i], duration)
+        self.heat[i] = max(self.heat[i], heat)
+        self.spread[i] = max(self.spread[i], spread)
+        self.burning.add((x, y))
+        if not self.scheduled:
+            self.schedule()
+
+    def schedule(self):
+        #the fire burns once a turn, for as long as anything is alight
+        self.scheduled = True
+        turns.schedule(TURN, self.act)
+
+    def act(self):
+        self.take_turn()
+        if self.burning:
+            return TURN
+        self.scheduled = False
+
+    def is_burning(self, x, y):
+        return (x, y) in self.burning
+
     def take_turn(self):
-        flame = self.owner
-        if self.duration > 0:
-            self.duration -= 1
-            #damage anything thats on the flame
-            for object in objects:
-                if object.fighter and object.x == flame.x and object.y == flame.y:
-                    object.fighter.take_damage(self.heat, "FIRE! FIRE EVERYWHERE!")
-                    message('Flames burn ' + object.name + ' for ' + str(self.heat) + ' hit points.', libtcod.red)
-            #randomly spread fire
-            new_flames = libtcod.random_get_int(0, 0, self.spread)
-            new_flames = new_flames/2 
-            while new_flames > 0:
-                x = libtcod.random_get_int(0, -1, 1)
-                y = libtcod.random_get_int(0, -1, 1)
-                x = flame.x + x
-                y = flame.y + y
-                new_flames = new_flames - 1
-                if not is_blocked(x,y):
-                    fire_spread_prevention = libtcod.random_get_int(0, 1, 3)
-                    flame_component = Flame( duration=3, heat=5, spread=(self.spread/fire_spread_prevention))
-                    fire = Object(x, y, ',', 'flame', libtcod.red, blocks=False, flame = flame_component)      
-                    objects.append(fire)  
+        #one step of the fire: every burning tile burns whatever is standing on it,
+        #randomly spreads and burns down. new flames are lit once every tile has had its turn.
+        new_flames = []
+        for (x, y) in list(self.burning):
+            i = x + y * self.width
+            if self.duration[i] > 0:
+                self.duration[i] -= 1
+                heat = self.heat[i]
+                #damage anything thats on the flame
+                for object in objects_at(x, y):
+                    if object.fighter:
+                        report('burn', object.name, heat, libtcod.red)
+                        object.fighter.take_damage(heat, "FIRE! FIRE EVERYWHERE!")
+                #randomly spread fire
+                count = libtcod.random_get_int(0, 0, self.spread[i])
+                count = count/2 
+                while count > 0:
+                    nx = x + libtcod.random_get_int(0, -1, 1)
+                    ny = y + libtcod.random_get_int(0, -1, 1)
+                    count = count - 1
+                    if not is_blocked(nx, ny):
+                        fire_spread_prevention = libtcod.random_get_int(0, 1, 3)
+                        new_flames.append((nx, ny, self.spread[i]/fire_spread_prevention))
+            else:
+                #burnt out
+                self.heat[i] = 0
+                self.spread[i] = 0
+                self.burning.remove((x, y))
+
+        for (x, y, spread) in new_flames:
+            self.ignite(x, y, duration=3, heat=5, spread=spread)
 
-                    
-        else:
-            objects.remove(flame)
                       
-class Fighter:
+def fighter_column(name):
+    #like entity_column, but for a component: the row is the owner's
+    def get(self):
+        return getattr(entities, name)[self.owner.id]
+    def set(self, value):
+        getattr(entities, name)[self.owner.id] = value
+    return property(get, set)
+
+class Fighter(object):
     #combat-related properties and methods (monster, player, NPC).
+    #the stats themselves live in the owner's row of the entity store.
+    hp = fighter_column('hp')
+    max_hp = fighter_column('max_hp')
+    defense = fighter_column('defense')
+    power = fighter_column('power')
+    xp = fighter_column('xp')
+
     def __init__(self, hp, defense, power,xp, death_function=None):
+        self.starting_stats = (hp, defense, power, xp)
+        self.death_function = death_function
+
+    def attach(self, owner):
+        self.owner = owner
+        (hp, defense, power, xp) = self.starting_stats
         self.max_hp = hp
         self.hp = hp
         self.defense = defense
         self.power = power
-        self.death_function = death_function
         self.xp = xp
 
  
@@ -282,7 +691,7 @@ class Fighter:
  
         if damage > 0:
             #make the target take some damage
-            message(self.owner.name.capitalize() + ' attacks ' + target.name + ' for ' + str(damage) + ' hit points.')
+            report('attack', self.owner.name.capitalize(), damage, libtcod.white, target.name)
             target.fighter.take_damage(damage, self.owner.name)
         else:
             message(self.owner.name.capitalize() + ' attacks ' + target.name + ' but it has no effect!')
@@ -309,21 +718,57 @@ class Fighter:
 class BasicMonster:
     #AI for a basic monster.
     global alert_level
+    goal = None  #where the monster is heading when it's too far off for the chase field
+    awake = False
+    speed = TURN
+
+    def __init__(self, speed=TURN):
+        self.speed = speed  #ticks between its turns
+
+    def act(self):
+        #its turn comes up: the ticks until the next one, or None if it's dead or fell asleep
+        if self.owner.ai is not self or not self.awake:
+            return None
+        self.take_turn()
+        if self.owner.ai is self and self.awake:
+            return self.speed
+
     def take_turn(self):
-        #a basic monster takes its turn. If you can see it, it can see you
+        #a basic monster takes its turn. If you can see it, it can see you, and if it can hear anything it comes for you
         monster = self.owner
-        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y) or monster.distance_to(player) <= alert_level:
- 
-            #move towards player if far away
-            if monster.distance_to(player) >= 2:
-                monster.move_towards(player.x, player.y)
-                Object.clear(self.owner)
+        dist = monster.distance_squared_to(player)
+        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y) or noise_field().level_at(monster.x, monster.y):
+ 
+            #move towards player if far away: down the chase field, along a path from further off,
+            #or straight at them if neither is any help
+            if dist >= 4:
+                field = chase_field()
+                step = field.next_step(monster.x, monster.y)
+                if step is None and field.distance_at(monster.x, monster.y) == UNREACHED:
+                    step = self.step_from_afar()
+                if step is not None and not is_blocked(monster.x + step[0], monster.y + step[1]):
+                    monster.move(*step)
+                else:
+                    monster.move_towards(player.x, player.y)
  
             #close enough, attack! (if the player is still alive.)
             #close enough, attack! (if the player is still alive.)
             elif player.fighter.hp > 0:
                 monster.fighter.attack(player)
 
+        else:
+            #out of sight and out of earshot: doze off until the player comes back
+            fall_asleep(monster)
+
+    def step_from_afar(self):
+        #follow a cached path to where the player was, and only look for a new one
+        #once the player has wandered off from there (or the monster got there)
+        monster = self.owner
+        if (self.goal is None or self.goal == (monster.x, monster.y) or
+            max(abs(self.goal[0] - player.x), abs(self.goal[1] - player.y)) > PATH_SLACK):
+            self.goal = (player.x, player.y)
+        return paths().next_step((monster.x, monster.y), self.goal)
+
 def check_level_up():
     #see if the player's experience is enough to level-up
     level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
@@ -368,10 +813,11 @@ def monster_death(monster, cause):
     monster.char = '%'
     monster.color = libtcod.dark_red
     monster.blocks = False
+    unregister(monster)
     monster.fighter = None
     monster.ai = None
     monster.name = 'remains of ' + monster.name
-    monster.send_to_back()
+    monster.set_layer(LAYER_FLOOR)
       
 class Item:
     #an item that can be picked up and used.
@@ -384,7 +830,7 @@ class Item:
             message('Your inventory is full, cannot pick up ' + self.owner.name + '.', libtcod.red)
         else:
             inventory.append(self.owner)
-            objects.remove(self.owner)
+            remove_object(self.owner)
             message('You picked up a ' + self.owner.name + '!', libtcod.green)
  
     def use(self):
@@ -394,45 +840,355 @@ class Item:
         else:
             if self.use_function() != 'cancelled':
                 inventory.remove(self.owner)  #destroy after use, unless it was cancelled for some reason
+                self.owner.destroy()
  
     def drop(self):
         #add to the map and remove from the player's inventory. also, place it at the player's coordinates
-        objects.append(self.owner)
         inventory.remove(self.owner)
         self.owner.x = player.x
         self.owner.y = player.y
+        add_object(self.owner)
         message('You dropped a ' + self.owner.name + '.', libtcod.yellow) 
 		
+#=========#
+#Map Class#
+#=========#
+
+class TileMap:
+    #the tiles of the map, stored as flat planes with one byte per tile, row by row
+    #(index x + y * width), instead of one Python object per tile
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        size = width * height
+ 
+        #all tiles start blocked (a wall also blocks sight) and unexplored
+        self.blocked = bytearray(b'\x01') * size
+        self.block_sight = bytearray(b'\x01') * size
+        self.explored = bytearray(size)
+        self.version = 0  #goes up whenever a tile changes, so anything worked out from the tiles knows to redo it
+
+    def blocked_at(self, x, y):
+        return self.blocked[x + y * self.width]
+
+    def blocks_sight_at(self, x, y):
+        return self.block_sight[x + y * self.width]
+
+    def explored_at(self, x, y):
+        return self.explored[x + y * self.width]
+
+    def explore(self, x, y):
+        self.explored[x + y * self.width] = 1
+
+    def carve(self, x1, y1, x2, y2):
+        #make every tile in the rectangle (x1, y1)-(x2, y2), inclusive, passable and see-through
+        length = x2 - x1 + 1
+        for y in range(y1, y2 + 1):
+            start = x1 + y * self.width
+            self.blocked[start:start + length] = bytearray(length)
+            self.block_sight[start:start + length] = bytearray(length)
+        self.version += 1
+
+    def set_tile(self, x, y, blocked, block_sight=None):
+        #change a single tile once the level is in play, keeping the FOV map in step
+        #and having the view painted over again
+        global fov_recompute, repaint_map, visible_tiles
+        if block_sight is None: block_sight = blocked
+        i = x + y * self.width
+        self.blocked[i] = blocked
+        self.block_sight[i] = block_sight
+        self.version += 1
+        libtcod.map_set_properties(fov_map, x, y, not block_sight, not blocked)
+        fov_recompute = True
+        repaint_map = True
+        visible_tiles = set()
+        if path_cache is not None and path_cache.tiles is self:
+            path_cache.tile_changed(x, y)
+
+    def transparency(self):
+        #one byte per tile, 1 where light passes: the inverse of block_sight
+        return self.block_sight.translate(INVERT_BYTES)
+
+    def walkability(self):
+        return self.blocked.translate(INVERT_BYTES)
+
+#swaps 0 and 1 bytes, to turn a "blocked" plane into an "open" one
+INVERT_BYTES = bytearray([1, 0]) + bytearray(range(2, 256))
+
 #==========#
-#Tile Class#
+#Flow Field#
 #==========#
 
-class Tile:
-    #a tile of the map and its properties
-    def __init__(self, blocked, block_sight = None):
-        self.blocked = blocked
- 
-        #all tiles start unexplored
-        self.explored = False
- 
-        #by default, if a tile is blocked, it also blocks sight
-        if block_sight is None: block_sight = blocked
-        self.block_sight = block_sight
+FLOW_RANGE = 40  #how many steps out from the player the chase field reaches
+UNREACHED = 255
+NEIGHBOURS = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+class FlowField:
+    #the number of steps from each tile to a goal, going round the walls, for every tile
+    #within FLOW_RANGE steps of it. it is worked out once for everyone: a monster chasing
+    #the goal just steps onto a neighbouring tile with a smaller count
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self.distance = bytearray([UNREACHED]) * (tiles.width * tiles.height)
+        self.reached = []  #indexes of the tiles with a count, to reset them cheaply
+        self.source = None
+
+    def update(self, goal_x, goal_y):
+        #breadth-first search out from the goal, only if it moved or the map changed since last time
+        if self.source == (goal_x, goal_y, self.tiles.version):
+            return
+        self.source = (goal_x, goal_y, self.tiles.version)
+
+        (width, height) = (self.tiles.width, self.tiles.height)
+        (distance, blocked) = (self.distance, self.tiles.blocked)
+        for i in self.reached:
+            distance[i] = UNREACHED
+        distance[goal_x + goal_y * width] = 0
+        self.reached = [goal_x + goal_y * width]
+        frontier = [(goal_x, goal_y)]
+        for steps in range(1, FLOW_RANGE + 1):
+            next_frontier = []
+            for (x, y) in frontier:
+                for (dx, dy) in NEIGHBOURS:
+                    (nx, ny) = (x + dx, y + dy)
+                    if 0 <= nx < width and 0 <= ny < height:
+                        i = nx + ny * width
+                        if distance[i] == UNREACHED and not blocked[i]:
+                            distance[i] = steps
+                            self.reached.append(i)
+                            next_frontier.append((nx, ny))
+            frontier = next_frontier
+
+    def distance_at(self, x, y):
+        return self.distance[x + y * self.tiles.width]
+
+    def next_step(self, x, y):
+        #the move (dx, dy) onto a free neighbouring tile closer to the goal (the one most in line
+        #with the goal if there are several), or None if there is no such tile or (x, y) is out of range
+        here = self.distance_at(x, y)
+        if here == UNREACHED:
+            return None
+        (goal_x, goal_y) = self.source[:2]
+        best = None
+        for (dx, dy) in NEIGHBOURS:
+            (nx, ny) = (x + dx, y + dy)
+            if not (0 <= nx < self.tiles.width and 0 <= ny < self.tiles.height):
+                continue
+            if self.distance_at(nx, ny) < here and not is_blocked(nx, ny):
+                off_line = (goal_x - nx) ** 2 + (goal_y - ny) ** 2
+                if best is None or off_line < best[0]:
+                    best = (off_line, dx, dy)
+        if best is None:
+            return None
+        return best[1:]
+
+def chase_field():
+    #the flow field towards the player, brought up to date if the player moved or the map changed
+    global player_flow
+    if player_flow is None or player_flow.tiles is not map:
+        player_flow = FlowField(map)
+    player_flow.update(player.x, player.y)
+    return player_flow
+
+player_flow = None
+
+#===========#
+#Pathfinding#
+#===========#
+
+MAX_PATH_NODES = 4000  #tiles an A* search may expand before it gives up
+MAX_CACHED_PATHS = 200  #when there are more than this, the cache starts over
+PATH_SLACK = 3  #how far the player may wander from a path's goal before it is looked for again
+
+def find_path(tiles, start, goal):
+    #A* over the tile map, moving in 8 directions at a cost of 1 a step. monsters are ignored
+    #(they move about), only walls count. returns the tiles to walk (goal last), or None
+    (width, blocked) = (tiles.width, tiles.blocked)
+    (goal_x, goal_y) = goal
+    came_from = {start: None}
+    cost = {start: 0}
+    queue = [(max(abs(goal_x - start[0]), abs(goal_y - start[1])), 0, start)]
+    expanded = 0
+    while queue and expanded < MAX_PATH_NODES:
+        (estimate, steps, (x, y)) = heapq.heappop(queue)
+        if (x, y) == goal:
+            path = []
+            while (x, y) != start:
+                path.append((x, y))
+                (x, y) = came_from[(x, y)]
+            path.reverse()
+            return path
+        if steps > cost[(x, y)]:
+            continue  #already reached more cheaply
+        expanded += 1
+        for (dx, dy) in NEIGHBOURS:
+            tile = (nx, ny) = (x + dx, y + dy)
+            if not (0 <= nx < width and 0 <= ny < tiles.height) or blocked[nx + ny * width]:
+                continue
+            if tile not in cost or steps + 1 < cost[tile]:
+                cost[tile] = steps + 1
+                came_from[tile] = (x, y)
+                heapq.heappush(queue, (steps + 1 + max(abs(goal_x - nx), abs(goal_y - ny)), steps + 1, tile))
+    return None
+
+class PathCache:
+    #paths found by find_path, kept until one of the tiles on them changes. a path is filed
+    #under every tile on it, so anyone standing on it (e.g. the monster that asked for it,
+    #a turn later) can carry on along it without a new search
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self.routes = {}  #(tile, goal) -> (path, index of the tile in the path)
+        self.crossing = {}  #tile -> the paths that go through it
+        self.count = 0
+
+    def find(self, start, goal):
+        #the tiles to walk from start to goal (goal last), or None if there's no way there
+        route = self.routes.get((start, goal))
+        if route is not None:
+            (path, i) = route
+            return path[i + 1:]
+        steps = find_path(self.tiles, start, goal)
+        if steps is None:
+            return None
+
+        if self.count >= MAX_CACHED_PATHS:
+            self.routes.clear()
+            self.crossing.clear()
+            self.count = 0
+        self.count += 1
+        path = [start] + steps
+        for (i, tile) in enumerate(path):
+            self.routes[(tile, goal)] = (path, i)
+            self.crossing.setdefault(tile, []).append(path)
+        return steps
+
+    def next_step(self, start, goal):
+        #the first move (dx, dy) on the way from start to goal, or None
+        steps = self.find(start, goal)
+        if not steps:
+            return None
+        return (steps[0][0] - start[0], steps[0][1] - start[1])
+
+    def tile_changed(self, x, y):
+        #forget the paths through a tile that was just changed (the rest are still good)
+        for path in self.crossing.pop((x, y), []):
+            goal = path[-1]
+            for tile in path:
+                route = self.routes.get((tile, goal))
+                if route is not None and route[0] is path:
+                    del self.routes[(tile, goal)]
+                if tile in self.crossing:
+                    self.crossing[tile] = [other for other in self.crossing[tile] if other is not path]
+
+def paths():
+    #the path cache for the current map
+    global path_cache
+    if path_cache is None or path_cache.tiles is not map:
+        path_cache = PathCache(map)
+    return path_cache
+
+path_cache = None
+
+#=====#
+#Noise#
+#=====#
+
+NOISE_FADE = 5  #how much quieter a bang gets each turn, until it dies away
+WILD_SHOT_NOISE = 20
+GERNADE_NOISE = 25
+MOLOTOV_NOISE = 8
+
+class NoiseMap:
+    #how loud it is on every tile. a noise of loudness L carries L steps, going round the
+    #walls rather than through them: the level on a tile is L + 1 at the source and one
+    #less for every step away, so a monster hears something wherever it isn't 0. it is
+    #worked out once for everyone and only spreads as far as the noises reach
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self.level = bytearray(tiles.width * tiles.height)
+        self.heard = []  #indexes of the tiles with some noise, to reset them cheaply
+        self.source = None
+
+    def update(self, sources):
+        #spread the (x, y, loudness) noises, only if they or the map changed since last time
+        if self.source == (sources, self.tiles.version):
+            return
+        self.source = (sources, self.tiles.version)
+
+        (width, height) = (self.tiles.width, self.tiles.height)
+        (level, blocked) = (self.level, self.tiles.blocked)
+        for i in self.heard:
+            level[i] = 0
+        self.heard = []
+
+        #the loudest tiles are spread from first, so each tile is settled the first time it's reached
+        loudest = min(255, max(loudness for (x, y, loudness) in sources) + 1)
+        by_level = [[] for l in range(loudest + 1)]
+        for (x, y, loudness) in sources:
+            i = x + y * width
+            here = min(255, loudness + 1)
+            if here > level[i]:
+                if not level[i]:
+                    self.heard.append(i)
+                level[i] = here
+                by_level[here].append(i)
+        for here in range(loudest, 1, -1):
+            for i in by_level[here]:
+                if level[i] != here:
+                    continue  #a louder noise got here since
+                (x, y) = (i % width, i // width)
+                for (dx, dy) in NEIGHBOURS:
+                    (nx, ny) = (x + dx, y + dy)
+                    if 0 <= nx < width and 0 <= ny < height:
+                        n = nx + ny * width
+                        if level[n] < here - 1 and not blocked[n]:
+                            if not level[n]:
+                                self.heard.append(n)
+                            level[n] = here - 1
+                            by_level[here - 1].append(n)
+
+    def level_at(self, x, y):
+        return self.level[x + y * self.tiles.width]
+
+def make_noise(x, y, loudness):
+    #something went bang at (x, y): it is heard for a few turns, fading as it goes
+    noises.append((x, y, loudness))
+    wake_within_earshot()
+
+def fade_noises():
+    global noises
+    noises = [(x, y, loudness - NOISE_FADE) for (x, y, loudness) in noises if loudness > NOISE_FADE]
+
+def noise_field():
+    #the noise map for the current map: the player, who carries alert_level steps, and any recent bangs
+    global noise_map
+    if noise_map is None or noise_map.tiles is not map:
+        noise_map = NoiseMap(map)
+    noise_map.update(tuple([(player.x, player.y, alert_level)] + noises))
+    return noise_map
+
+noise_map = None
+noises = []
 		
 #=============#
 #Map Generator#
 #=============#
 
 def make_map():
-    global map, objects, stairs
+    global map, objects, stairs, fire, noises
  
-    #the list of objects with just the player
-    objects = [player]
+    #the list of objects starts empty, the player is added once placed in the first room
+    objects = []
+    reset_occupancy()
+    reset_layers()
+    reset_turn_order()
  
     #fill map with "blocked" tiles
-    map = [[ Tile(True)
-        for y in range(MAP_HEIGHT) ]
-            for x in range(MAP_WIDTH) ]
+    map = TileMap(MAP_WIDTH, MAP_HEIGHT)
+
+    #nothing is burning (or making a noise) yet
+    noises = []
+    fire = Fire(MAP_WIDTH, MAP_HEIGHT)
  
     rooms = []
     num_rooms = 0
@@ -484,6 +1240,7 @@ def make_map():
                 elif not is_blocked(new_x,new_y - 1):
                     player.x = new_x + 1
                     player.y = new_y - 1                    
+                add_object(player)
                     
             else:
                 #all rooms after the first:
@@ -508,7 +1265,7 @@ def make_map():
 
 	#create stairs at the center of the last room
     stairs = Object(new_x, new_y, '<', 'stairs', libtcod.white, always_visible=True)
-    objects.append(stairs)
+    add_object(stairs)
 			
 class Rect:
     #a rectangle on the map. used to characterize a room.
@@ -530,25 +1287,15 @@ class Rect:
                 self.y1 <= other.y2 and self.y2 >= other.y1)		
 		
 def create_h_tunnel(x1, x2, y):
-    global map
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False
+    map.carve(min(x1, x2), y, max(x1, x2), y)
 		
 def create_v_tunnel(y1, y2, x):
-    global map
     #vertical tunnel
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False		
+    map.carve(x, min(y1, y2), x, max(y1, y2))
 		
 def create_room(room):
-    global map
-    #go through the tiles in the rectangle and make them passable
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            map[x][y].blocked = False
-            map[x][y].block_sight = False
+    #make the tiles inside the rectangle passable, one row at a time
+    map.carve(room.x1 + 1, room.y1 + 1, room.x2 - 1, room.y2 - 1)
 					
 def place_objects(room):
 
@@ -576,7 +1323,7 @@ def place_objects(room):
                 monster = Object(x, y, 'Z', 'Strong Zombie', libtcod.darker_green, blocks=True, 
 				     fighter = fighter_component, ai = ai_component)
                 
-            objects.append(monster)
+            add_object(monster)
             
 			#choose random number of items
     num_items = libtcod.random_get_int(0, 0, MAX_ROOM_ITEMS)
@@ -611,9 +1358,8 @@ def place_objects(room):
                 item_component = Item(use_function=throw_gernade)
                 item = Object(x, y, '#', 'Hand Gernade', libtcod.light_red, item=item_component)
 				
-            objects.append(item)
-            item.send_to_back()  #items appear below other objects
-            item.always_visible = True      
+            item.always_visible = True  #items are remembered once seen
+            add_object(item)
 			
 def next_level():
     global dungeon_level, alert_level
@@ -625,82 +1371,236 @@ def next_level():
     message('After a rare moment of peace, you descend deeper into the heart of the dungeon...', libtcod.red)
     dungeon_level += 1
     alert_level = alert_level//2
+
+    #everything left behind on this level is gone for good (the inventory isn't on the map)
+    for object in objects:
+        if object is not player:
+            object.destroy()
     make_map()  #create a fresh new level!
     initialize_fov()			
+#======#
+#Camera#
+#======#
+
+#con holds only the part of the map under the camera, in screen coordinates.
+#camera_x, camera_y is the map position shown in its top-left corner
+camera_x = 0
+camera_y = 0
+
+def move_camera(x, y):
+    #keep (x, y) at least a torch radius away from the edges of the view: when it gets closer,
+    #centre the camera on it again (but never past the edges of the map).
+    #returns True if the camera moved
+    global camera_x, camera_y
+    (new_x, new_y) = (camera_x, camera_y)
+    if not camera_x + TORCH_RADIUS <= x < camera_x + CAMERA_WIDTH - TORCH_RADIUS:
+        new_x = x - CAMERA_WIDTH / 2
+    if not camera_y + TORCH_RADIUS <= y < camera_y + CAMERA_HEIGHT - TORCH_RADIUS:
+        new_y = y - CAMERA_HEIGHT / 2
+    new_x = max(0, min(MAP_WIDTH - CAMERA_WIDTH, new_x))
+    new_y = max(0, min(MAP_HEIGHT - CAMERA_HEIGHT, new_y))
+    if (new_x, new_y) == (camera_x, camera_y):
+        return False
+    (camera_x, camera_y) = (new_x, new_y)
+    return True
+
+def on_screen(x, y):
+    return camera_x <= x < camera_x + CAMERA_WIDTH and camera_y <= y < camera_y + CAMERA_HEIGHT
+
+def to_screen(x, y):
+    return (x - camera_x, y - camera_y)
+
+def mouse_tile(mouse):
+    #the map position under the mouse, or (None, None) if it isn't over the map
+    (x, y) = (mouse.cx + camera_x, mouse.cy + camera_y)
+    if (0 <= mouse.cx < CAMERA_WIDTH and 0 <= mouse.cy < CAMERA_HEIGHT and
+        0 <= x < MAP_WIDTH and 0 <= y < MAP_HEIGHT):
+        return (x, y)
+    return (None, None)
+
 #=============#
 #Render screen#
 #=============#
-def render_all(target=False):
-    global fov_map, color_dark_wall, color_light_wall
-    global color_dark_ground, color_light_ground
-    global fov_recompute
- 
+def tile_state(x, y, visible):
+    #index into tile_colors: lit if it's in view, the remembered (dark) colour if explored
+    wall = map.blocks_sight_at(x, y)
+    if visible:
+        return 3 + wall
+    if map.explored_at(x, y):
+        return 1 + wall
+    return 0
+
+def paint_tile(x, y, visible):
+    #set a map tile's background, if it's under the camera
+    if on_screen(x, y):
+        (sx, sy) = to_screen(x, y)
+        libtcod.console_set_back(con, sx, sy, tile_colors[tile_state(x, y, visible)], libtcod.BKGND_SET)
+
+if numpy_available:
+    tile_state_colors = numpy.array([(color.r, color.g, color.b) for color in tile_colors])
+
+def fill_map_background(visible):
+    #work out the state of every tile under the camera from the explored/visible masks and
+    #the walls, then hand the three colour planes to con in a single call
+    (w, h) = (min(CAMERA_WIDTH, MAP_WIDTH), min(CAMERA_HEIGHT, MAP_HEIGHT))
+    view = (slice(camera_y, camera_y + h), slice(camera_x, camera_x + w))
+    wall = numpy.frombuffer(map.block_sight, dtype=numpy.uint8).reshape(MAP_HEIGHT, MAP_WIDTH)[view]
+    explored = numpy.frombuffer(map.explored, dtype=numpy.uint8).reshape(MAP_HEIGHT, MAP_WIDTH)[view]
+    lit = numpy.zeros((h, w), dtype=bool)
+    for (x, y) in visible:
+        if on_screen(x, y):
+            lit[y - camera_y, x - camera_x] = True
+
+    #a map smaller than the camera leaves the rest of con unexplored (black)
+    state = numpy.zeros((CAMERA_HEIGHT, CAMERA_WIDTH), dtype=int)
+    state[:h, :w] = numpy.where(lit, 3 + wall, numpy.where(explored, 1 + wall, 0))
+    colors = tile_state_colors[state.ravel()]
+    libtcod.console_fill_background(con, colors[:, 0], colors[:, 1], colors[:, 2])
+
+def render_all():
+    global fov_recompute, visible_tiles, drawn_glyphs, repaint_map
+ 
+    if move_camera(player.x, player.y):
+        #the view scrolled: everything on con is in the wrong place, start it over
+        #(the tiles in view too, so they are painted lit again rather than left dark)
+        libtcod.console_clear(con)
+        drawn_glyphs = {}
+        visible_tiles = set()
+        repaint_map = True
+        fov_recompute = True
+
     if fov_recompute:
         #recompute FOV if needed (the player moved or something)
         fov_recompute = False
         libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
- 
-        #go through all tiles, and set their background color according to the FOV
-        for y in range(MAP_HEIGHT):
-            for x in range(MAP_WIDTH):
-                visible = libtcod.map_is_in_fov(fov_map, x, y)
-                wall = map[x][y].block_sight
-                if not visible:
-                    #if it's not visible right now, the player can only see it if it's explored
-                    if map[x][y].explored:
-                        if wall:
-                            libtcod.console_set_back(con, x, y, color_dark_wall, libtcod.BKGND_SET)
-                        else:
-                            libtcod.console_set_back(con, x, y, color_dark_ground, libtcod.BKGND_SET)
-                else:
-                    #it's visible
-                    if wall:
-                        libtcod.console_set_back(con, x, y, color_light_wall, libtcod.BKGND_SET )
-                    else:
-                        libtcod.console_set_back(con, x, y, color_light_ground, libtcod.BKGND_SET )
-                    #since it's visible, explore it
-                    map[x][y].explored = True
- 
-    #draw all objects in the list, except the player. we want it to
-    #always appear over all other objects! so it's drawn later.
-    if target is False:
-        for object in objects:
-            if object != player:
-                object.draw()
-        player.draw()
-    
+
+        #nothing beyond the torch radius can be in view, so only that square around the player is tested
+        now_visible = set()
+        for y in range(max(0, player.y - TORCH_RADIUS), min(MAP_HEIGHT, player.y + TORCH_RADIUS + 1)):
+            for x in range(max(0, player.x - TORCH_RADIUS), min(MAP_WIDTH, player.x + TORCH_RADIUS + 1)):
+                if libtcod.map_is_in_fov(fov_map, x, y):
+                    now_visible.add((x, y))
+        wake_in_view(now_visible - visible_tiles)
+
+        if numpy_available:
+            #since it's visible, explore it
+            for (x, y) in now_visible - visible_tiles:
+                map.explore(x, y)
+            #the whole background goes to con in one call, so there is nothing to repaint tile by tile
+            repaint_map = False
+            fill_map_background(now_visible)
+        else:
+            if repaint_map:
+                #con was cleared (new level, loaded game or the view scrolled):
+                #paint everything explored so far under the camera
+                repaint_map = False
+                for y in range(camera_y, min(MAP_HEIGHT, camera_y + CAMERA_HEIGHT)):
+                    for x in range(camera_x, min(MAP_WIDTH, camera_x + CAMERA_WIDTH)):
+                        if map.explored_at(x, y):
+                            paint_tile(x, y, False)
+
+            #repaint only the tiles that came into or went out of view
+            for (x, y) in visible_tiles - now_visible:
+                paint_tile(x, y, False)
+            for (x, y) in now_visible - visible_tiles:
+                paint_tile(x, y, True)
+                #since it's visible, explore it
+                map.explore(x, y)
+        visible_tiles = now_visible
+ 
+    #draw the objects, but only touch the tiles whose character changed since the last frame
+    glyphs = visible_glyphs()
+    for (x, y) in drawn_glyphs:
+        if (x, y) not in glyphs:
+            (sx, sy) = to_screen(x, y)
+            libtcod.console_put_char(con, sx, sy, ' ', libtcod.BKGND_NONE)
+    for ((x, y), (char, color)) in glyphs.items():
+        if drawn_glyphs.get((x, y)) != (char, color):
+            (sx, sy) = to_screen(x, y)
+            libtcod.console_set_foreground_color(con, color)
+            libtcod.console_put_char(con, sx, sy, char, libtcod.BKGND_NONE)
+    drawn_glyphs = glyphs
         
     #blit the contents of "con" to the root console
-    libtcod.console_blit(con, 0, 0, MAP_WIDTH, MAP_HEIGHT, 0, 0, 0)
+    libtcod.console_blit(con, 0, 0, CAMERA_WIDTH, CAMERA_HEIGHT, 0, 0, 0)
  
  
-    #prepare to render the GUI panel
+    render_panel()
+
+#=========#
+#HUD Panel#
+#=========#
+
+#the panel is split into regions (mouse-over names, HP bar, XP bar, levels, messages).
+#each one remembers the values it was last drawn from, and is only redrawn and
+#blitted to the root console when those change
+panel_cache = {}
+
+def invalidate_panel():
+    #something was drawn over the panel on the root console (a menu), so redraw it all
+    panel_cache.clear()
+
+def panel_region_changed(name, values):
+    if panel_cache.get(name) == values:
+        return False
+    panel_cache[name] = values
+    return True
+
+def clear_panel_region(x, y, w, h):
     libtcod.console_set_background_color(panel, libtcod.black)
-    libtcod.console_clear(panel)
- 
-    #print the game messages, one line at a time
-    y = 1
-    for (line, color) in game_msgs:
-        libtcod.console_set_foreground_color(panel, color)
-        libtcod.console_print_left(panel, MSG_X, y, libtcod.BKGND_NONE, line)
-        y += 1
- 
-    #show the player's stats
-    render_bar(1, 1, BAR_WIDTH, 'HP', player.fighter.hp, player.fighter.max_hp,
-        libtcod.light_red, libtcod.darker_red)
-        
-    render_bar(1, 2, BAR_WIDTH, 'XP', player.fighter.xp, LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR,
-        libtcod.light_green, libtcod.darker_green)    
+    libtcod.console_rect(panel, x, y, w, h, True)
+
+def blit_panel_region(x, y, w, h):
+    libtcod.console_blit(panel, x, y, w, h, 0, x, PANEL_Y + y)
+
+def render_panel():
+    #nothing cached (first frame, or after a menu): start from a blank panel and blit all of it at the end
+    redraw_all = not panel_cache
+    if redraw_all:
+        libtcod.console_set_background_color(panel, libtcod.black)
+        libtcod.console_clear(panel)
 
-    libtcod.console_print_left(panel, 1, 3, libtcod.BKGND_NONE, 'Player level ' + str(player.level))
-    libtcod.console_print_left(panel, 1, 4, libtcod.BKGND_NONE, 'Dungeon level ' + str(dungeon_level))	
-	
 	#display names of objects under the mouse
-    libtcod.console_set_foreground_color(panel, libtcod.light_gray)
-    libtcod.console_print_left(panel, 1, 0, libtcod.BKGND_NONE, get_names_under_mouse())
- 
-    #blit the contents of "panel" to the root console
-    libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)	
+    names = get_names_under_mouse()
+    if panel_region_changed('names', names):
+        clear_panel_region(0, 0, SCREEN_WIDTH, 1)
+        libtcod.console_set_foreground_color(panel, libtcod.light_gray)
+        libtcod.console_print_left(panel, 1, 0, libtcod.BKGND_NONE, names)
+        blit_panel_region(0, 0, SCREEN_WIDTH, 1)
+
+    #show the player's stats
+    if panel_region_changed('hp', (player.fighter.hp, player.fighter.max_hp)):
+        clear_panel_region(1, 1, BAR_WIDTH, 1)
+        render_bar(1, 1, BAR_WIDTH, 'HP', player.fighter.hp, player.fighter.max_hp,
+            libtcod.light_red, libtcod.darker_red)
+        blit_panel_region(1, 1, BAR_WIDTH, 1)
+
+    level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
+    if panel_region_changed('xp', (player.fighter.xp, level_up_xp)):
+        clear_panel_region(1, 2, BAR_WIDTH, 1)
+        render_bar(1, 2, BAR_WIDTH, 'XP', player.fighter.xp, level_up_xp,
+            libtcod.light_green, libtcod.darker_green)    
+        blit_panel_region(1, 2, BAR_WIDTH, 1)
+
+    if panel_region_changed('levels', (player.level, dungeon_level)):
+        clear_panel_region(0, 3, MSG_X, 2)
+        libtcod.console_set_foreground_color(panel, libtcod.white)
+        libtcod.console_print_left(panel, 1, 3, libtcod.BKGND_NONE, 'Player level ' + str(player.level))
+        libtcod.console_print_left(panel, 1, 4, libtcod.BKGND_NONE, 'Dungeon level ' + str(dungeon_level))	
+        blit_panel_region(0, 3, MSG_X, 2)
+
+    #print the game messages, one line at a time
+    if panel_region_changed('messages', (game_msgs.version, game_msgs.scroll)):
+        clear_panel_region(MSG_X, 1, MSG_WIDTH, MSG_HEIGHT)
+        y = 1
+        for (line, color) in game_msgs.lines(MSG_WIDTH, MSG_HEIGHT):
+            libtcod.console_set_foreground_color(panel, color)
+            libtcod.console_print_left(panel, MSG_X, y, libtcod.BKGND_NONE, line)
+            y += 1
+        blit_panel_region(MSG_X, 1, MSG_WIDTH, MSG_HEIGHT)
+
+    if redraw_all:
+        libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)	
 
 #===#
 #GUI#
@@ -724,41 +1624,132 @@ def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
     libtcod.console_print_center(panel, x + total_width / 2, y, libtcod.BKGND_NONE,
         name + ': ' + str(value) + '/' + str(maximum))
 		
+class MessageLog:
+    #the last few thousand messages, as they were sent. once the log is full the
+    #oldest message falls off the far end of the ring, so adding one is O(1).
+    #messages are only split into lines when they're shown, and the lines are
+    #remembered for each width they've been wrapped to.
+    def __init__(self, capacity):
+        self.messages = collections.deque(maxlen=capacity)
+        self.version = 0  #goes up with every new message, so the panel knows to redraw
+        self.scroll = 0  #how many lines back from the newest one the view is scrolled
+
+    def append(self, text, color):
+        #each entry is [text, color, {width: wrapped lines}]
+        self.messages.append([text, color, {}])
+        self.version += 1
+        self.scroll = 0  #jump back to the newest messages
+
+    def scroll_by(self, lines, width, count):
+        #positive scrolls back into the history, negative towards the newest messages, but
+        #never past the top of the history as it's shown (count lines of the given width)
+        scroll = max(0, self.scroll + lines)
+        available = len(self.newest_lines(width, scroll + count))
+        self.scroll = max(0, min(scroll, available - count))
+
+    def newest_lines(self, width, wanted):
+        #at least wanted lines (text, color), newest first, wrapping only the newest messages
+        #(fewer if the history runs out)
+        found = []
+        for entry in reversed(self.messages):
+            (text, color, wrapped) = entry
+            if width not in wrapped:
+                wrapped[width] = textwrap.wrap(text, width)
+            for line in reversed(wrapped[width]):
+                found.append((line, color))
+            if len(found) >= wanted:
+                break
+        return found
+
+    def lines(self, width, count):
+        #the count lines (text, color) that fit the view, oldest first
+        found = self.newest_lines(width, count + self.scroll)
+        found = found[self.scroll:self.scroll + count]
+        found.reverse()
+        return found
+
 def message(new_msg, color = libtcod.white):
-    #split the message if necessary, among multiple lines
-    new_msg_lines = textwrap.wrap(new_msg, MSG_WIDTH)
- 
-    for line in new_msg_lines:
-        #if the buffer is full, remove the first line to make room for the new one
-        if len(game_msgs) == MSG_HEIGHT:
-            del game_msgs[0]
- 
-        #add the new line as a tuple, with the text and the color
-        game_msgs.append( (line, color) )
+    #add the message to the log, it's split among multiple lines when it's shown.
+    #anything reported before it goes in first, so the log stays in order
+    flush_events()
+    game_msgs.append(new_msg, color)
+
+#how each kind of reported event reads: (happened once, happened several times)
+EVENT_TEXT = {
+    'burn': ('Flames burn %(name)s for %(amount)d hit points.',
+        'Flames burn %(name)s x%(count)d for %(amount)d total hit points.'),
+    'blast': ('The %(name)s gets damaged for %(amount)d hit points.',
+        'The %(name)s x%(count)d get damaged for %(amount)d total hit points.'),
+    'attack': ('%(name)s attacks %(target)s for %(amount)d hit points.',
+        '%(name)s x%(count)d attack %(target)s for %(amount)d total hit points.'),
+    }
+
+#reported events waiting to become messages. events of the same kind with the same
+#names are merged (counted and their amounts added up) before any text is made
+pending_events = collections.OrderedDict()
+
+def report(kind, name, amount, color, target=None):
+    key = (kind, name, target)
+    if key in pending_events:
+        pending_events[key][0] += 1
+        pending_events[key][1] += amount
+    else:
+        pending_events[key] = [1, amount, color]
+
+def flush_events():
+    #turn the merged events into messages
+    if not pending_events:
+        return
+    events = list(pending_events.items())
+    pending_events.clear()
+    for ((kind, name, target), (count, amount, color)) in events:
+        (once, several) = EVENT_TEXT[kind]
+        if count == 1:
+            text = once
+        else:
+            text = several
+        game_msgs.append(text % {'name': name, 'target': target, 'count': count, 'amount': amount}, color)
 
 def get_names_under_mouse():
     #return a string with the names of all objects under the mouse
-    mouse = libtcod.mouse_get_status()
-    (x, y) = (mouse.cx, mouse.cy)
+    (x, y) = mouse_tile(libtcod.mouse_get_status())
  
     #create a list with the names of all objects at the mouse's coordinates and in FOV
-    names = [obj.name for obj in objects
-        if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
+    names = []
+    if (x, y) in visible_tiles:
+        names = [obj.name for obj in objects_at(x, y)]
+        if fire.is_burning(x, y):
+            names.append('flame')
  
     names = ', '.join(names)  #join the names, separated by commas
     return names.capitalize()
 
-def menu(header, options, width):
-    if len(options) > 26: raise ValueError('Cannot have a menu with more than 26 options.')
- 
+#off-screen consoles for menu windows, kept and reused by size instead of making a new one each time
+window_pool = {}
+
+#windows of static dialogs (the help screen, the main menu), drawn once and kept as they are
+static_menus = {}
+
+def pooled_console(width, height):
+    window = window_pool.get((width, height))
+    if window is None:
+        window = window_pool[(width, height)] = libtcod.console_new(width, height)
+    else:
+        libtcod.console_clear(window)  #left over from the last menu of this size
+    return window
+
+def draw_menu_window(header, options, width, static):
     #calculate total height for the header (after auto-wrap) and one line per option
     header_height = libtcod.console_height_left_rect(con, 0, 0, width, SCREEN_HEIGHT, header)
     if header == '':
         header_height = 0
     height = len(options) + header_height
  
-    #create an off-screen console that represents the menu's window
-    window = libtcod.console_new(width, height)
+    #the off-screen console that represents the menu's window: a static dialog keeps one of its own
+    if static:
+        window = libtcod.console_new(width, height)
+    else:
+        window = pooled_console(width, height)
  
     #print the header, with auto-wrap
     libtcod.console_set_foreground_color(window, libtcod.white)
@@ -772,6 +1763,19 @@ def menu(header, options, width):
         libtcod.console_print_left(window, 0, y, libtcod.BKGND_NONE, text)
         y += 1
         letter_index += 1
+    return (window, height)
+
+def menu(header, options, width, static=False):
+    #static: the text never changes, so the window is laid out and drawn only the first time
+    if len(options) > 26: raise ValueError('Cannot have a menu with more than 26 options.')
+ 
+    layout = (header, tuple(options), width)
+    if static and layout in static_menus:
+        (window, height) = static_menus[layout]
+    else:
+        (window, height) = draw_menu_window(header, options, width, static)
+        if static:
+            static_menus[layout] = (window, height)
  
     #blit the contents of "window" to the root console
     x = SCREEN_WIDTH/2 - width/2
@@ -781,6 +1785,7 @@ def menu(header, options, width):
     #present the root console to the player and wait for a key-press
     libtcod.console_flush()	
     key = libtcod.console_wait_for_keypress(True)
+    invalidate_panel()  #the window covered part of the screen
  
     if key.vk == libtcod.KEY_ENTER and key.lalt:  #(special case) Alt+Enter: toggle fullscreen
         libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
@@ -808,8 +1813,8 @@ def quit_confirmation():
     index = menu("Are you sure you want to quit?", options, INVENTORY_WIDTH)
     return index
 
-def msgbox(text, width=50):
-    menu(text, [], width)  #use menu() as a sort of "message box"
+def msgbox(text, width=50, static=False):
+    menu(text, [], width, static)  #use menu() as a sort of "message box"
         
 #==================#
 #User input handler#
@@ -818,12 +1823,12 @@ def msgbox(text, width=50):
 #Checks if movement is blocked
 def is_blocked(x, y):
     #first test the map tile
-    if map[x][y].blocked:
+    if map.blocked_at(x, y):
         return True
  
     #now check for any blocking objects
-    for object in objects:
-        if object.blocks and object.x == x and object.y == y:
+    for object in objects_at(x, y):
+        if object.blocks:
             return True
  
     return False	
@@ -838,8 +1843,8 @@ def player_move_or_attack(dx, dy):
  
     #try to find an attackable object there
     target = None
-    for object in objects:
-        if object.fighter and object.x == x and object.y == y:
+    for object in objects_at(x, y):
+        if object.fighter:
             target = object
 
  
@@ -853,38 +1858,77 @@ def player_move_or_attack(dx, dy):
         player.move(dx, dy)
         fov_recompute = True	
 
+def in_target_range(x, y, max_range):
+    #a tile can be targeted if it's in FOV, and in case a range is specified, if it's in that range
+    return (x, y) in visible_tiles and (max_range is None or player.distance(x, y) <= max_range)
+
+def restore_target_cell(x, y, max_range):
+    #copy the tile back from con, then put the range overlay on it again
+    (sx, sy) = to_screen(x, y)
+    libtcod.console_blit(con, sx, sy, 1, 1, 0, sx, sy)
+    if max_range is not None and in_target_range(x, y, max_range):
+        libtcod.console_set_back(0, sx, sy, target_tile_colors[tile_state(x, y, True)], libtcod.BKGND_SET)
+
 def target_tile(max_range=None):
     #return the position of a tile left-clicked in player's FOV (optionally in a range), or (None,None) if right-clicked.
-    while True:
-        render_all(True)
-        #render the screen. this erases the inventory and shows the names of objects under the mouse.
-        libtcod.console_flush()
-        
-        for object in objects:
-            object.draw()
- 
+    #the map is rendered once (this erases the inventory); after that only the cursor
+    #and the names under the mouse are redrawn, and only when the mouse moves
+    render_all()
+    if max_range is not None:
+        for (x, y) in visible_tiles:
+            if in_target_range(x, y, max_range):
+                (sx, sy) = to_screen(x, y)
+                libtcod.console_set_back(0, sx, sy, target_tile_colors[tile_state(x, y, True)], libtcod.BKGND_SET)
+    cursor = None
+    redraw = True
+
+    while not libtcod.console_is_window_closed():
+        if redraw:
+            redraw = False
+            libtcod.console_flush()
+
         key = libtcod.console_check_for_keypress()
         mouse = libtcod.mouse_get_status()  #get mouse position and click status
-        (x, y) = (mouse.cx, mouse.cy)
- 
+        (x, y) = mouse_tile(mouse)
+
         if mouse.rbutton_pressed or key.vk == libtcod.KEY_ESCAPE:
-            for object in objects:
-                object.clear()
-            return (None, None)  #cancel if the player right-clicked or pressed Escape
- 
-        #accept the target if the player clicked in FOV, and in case a range is specified, if it's in that range
-        if (mouse.lbutton_pressed and libtcod.map_is_in_fov(fov_map, x, y) and
-            (max_range is None or player.distance(x, y) <= max_range)):
-            for object in objects:
-                object.clear()
-
-            return (x, y)
-
-def handle_keys():
-    key = libtcod.console_check_for_keypress(libtcod.KEY_PRESSED)
-    mouse = libtcod.mouse_get_status()
-    (x, y) = (mouse.cx, mouse.cy)
-    (mousex, mousey) = (x - player.x, y - player.y)   
+            result = (None, None)  #cancel if the player right-clicked or pressed Escape
+            break
+
+        if mouse.lbutton_pressed and in_target_range(x, y, max_range):
+            result = (x, y)
+            break
+
+        if (x, y) == cursor:
+            #nothing happened, wait a moment instead of spinning
+            libtcod.sys_sleep_milli(IDLE_WAIT_MS)
+            continue
+
+        #move the highlight to the tile under the mouse
+        if cursor is not None and cursor[0] is not None:
+            restore_target_cell(cursor[0], cursor[1], max_range)
+        cursor = (x, y)
+        if x is not None:
+            (sx, sy) = to_screen(x, y)
+            if in_target_range(x, y, max_range):
+                libtcod.console_set_back(0, sx, sy, color_target_ok, libtcod.BKGND_SET)
+            else:
+                libtcod.console_set_back(0, sx, sy, color_target_bad, libtcod.BKGND_SET)
+        render_panel()
+        redraw = True
+    else:
+        result = (None, None)
+
+    #take the overlay off the root console again
+    libtcod.console_blit(con, 0, 0, CAMERA_WIDTH, CAMERA_HEIGHT, 0, 0, 0)
+    return result
+
+def handle_keys(key, mouse):
+    (x, y) = mouse_tile(mouse)
+    if x is not None:
+        (mousex, mousey) = (x - player.x, y - player.y)
+    else:
+        (mousex, mousey) = (None, None)  #not over the map
     
     if key.vk == libtcod.KEY_ENTER and key.lalt:
         #Alt+Enter: toggle fullscreen
@@ -916,8 +1960,8 @@ def handle_keys():
         
         elif key.vk == libtcod.KEY_KP5:
             action_taken =False
-            for object in objects:  #look for an item in the player's tile
-                if object.x == player.x and object.y == player.y and object.item :
+            for object in list(objects_at(player.x, player.y)):  #look for an item in the player's tile
+                if object.item :
                     object.item.pick_up()
                     action_taken = True
             if stairs.x == player.x and stairs.y == player.y:
@@ -937,7 +1981,7 @@ def handle_keys():
             player_move_or_attack( 1,-1) 
             
              
-        elif (mouse.lbutton_pressed and mousex < 2 and mousex > -2 and mousey < 2 and mousey > -2):
+        elif (mouse.lbutton_pressed and mousex is not None and mousex < 2 and mousex > -2 and mousey < 2 and mousey > -2):
             player_move_or_attack(mousex, mousey)
         
         elif key.vk == libtcod.KEY_UP:
@@ -951,6 +1995,15 @@ def handle_keys():
  
         elif key.vk == libtcod.KEY_RIGHT:
             player_move_or_attack(1, 0)
+
+        elif key.vk == libtcod.KEY_PAGEUP:
+            #scroll the message log back through older messages
+            game_msgs.scroll_by(MSG_HEIGHT - 1, MSG_WIDTH, MSG_HEIGHT)
+            return 'didnt-take-turn'
+
+        elif key.vk == libtcod.KEY_PAGEDOWN:
+            game_msgs.scroll_by(-(MSG_HEIGHT - 1), MSG_WIDTH, MSG_HEIGHT)
+            return 'didnt-take-turn'
                         
         elif chr(key.c) == 'i':
             #show the inventory; if an item is selected, use it
@@ -968,8 +2021,8 @@ def handle_keys():
 
             if key_char == 'g':
                 #pick up an item
-                for object in objects:  #look for an item in the player's tile
-                    if object.x == player.x and object.y == player.y and object.item :
+                for object in objects_at(player.x, player.y):  #look for an item in the player's tile
+                    if object.item :
                         object.item.pick_up()
                         break
 
@@ -994,8 +2047,8 @@ def handle_keys():
             if key_char == '?':
                 #show controls
                 msgbox("Controls:"+"\narrows/numpad    = move/attack" +"\ni    = inventory"+"\ng    = pick up item at player's feet"+
-                "\nd    = drop an item in inventory"+"\n<    = use the stairs at player's feet"+"\nc    = character sheet"+
-                "\nr    = new game (when dead)"+"\n\nalt+enter    =fullscreen mode"+"\nesc          = quit game")       
+                "\nd    = drop an item in inventory"+"\n<    = use the stairs at player's feet"+"\nc    = character sheet"+"\npgup/pgdn    = scroll messages"+
+                "\nr    = new game (when dead)"+"\n\nalt+enter    =fullscreen mode"+"\nesc          = quit game", static=True)
 			
             return 'didnt-take-turn'
 			
@@ -1023,23 +2076,27 @@ def wild_shot():
     message('A wild gunshot hits ' + monster.name + ' with a loud blast! The damage is '
         + str(WILD_SHOT_DAMAGE) + ' hit points.', libtcod.light_blue)
     monster.fighter.take_damage(WILD_SHOT_DAMAGE, "wild_shot")	
+    make_noise(player.x, player.y, WILD_SHOT_NOISE)
     alert_level += 3
 
 def throw_gernade():
-    global alert_level
-
     #ask the player for a target tile to throw a gernade at
     message('Left-click a target tile for the gernade, or right-click to cancel.', libtcod.light_cyan)
     (x, y) = target_tile()
 
     if x is None: return 'cancelled'
+    message('You pull the pin and throw the gernade.', libtcod.orange)
+    turns.schedule(GERNADE_FUSE, lambda: explode_gernade(x, y))
+
+def explode_gernade(x, y):
+    global alert_level
     message('The gernade explodes, harming everything within ' + str(GERNADE_RADIUS) + ' tiles!', libtcod.orange)
+    make_noise(x, y, GERNADE_NOISE)
     
-    for obj in objects:  #damage every fighter in range, including the player
-        if obj.distance(x, y) <= GERNADE_RADIUS and obj.fighter:
-            message('The ' + obj.name + ' gets damaged for ' + str(GERNADE_DAMAGE) + ' hit points.', libtcod.orange)
-            obj.fighter.take_damage(GERNADE_DAMAGE, "......your own hand gernade....nice..")
-            alert_level +=3
+    for obj in fighters_within(x, y, GERNADE_RADIUS):  #damage every fighter in range, including the player
+        report('blast', obj.name, GERNADE_DAMAGE, libtcod.orange)
+        obj.fighter.take_damage(GERNADE_DAMAGE, "......your own hand gernade....nice..")
+        alert_level +=3
 
 def throw_molotov():
     global alert_level
@@ -1049,9 +2106,8 @@ def throw_molotov():
     if x is None: 
         return 'cancelled'
     
-    flame_component = Flame( duration=5, heat=5, spread=6)
-    fire = Object(x, y, ',', 'flame', libtcod.red, blocks=False, flame = flame_component)      
-    objects.append(fire)  
+    fire.ignite(x, y, duration=5, heat=5, spread=6)
+    make_noise(x, y, MOLOTOV_NOISE)
     alert_level += 1
         
 #=============#
@@ -1072,14 +2128,18 @@ def save_game():
     file['game_state'] = game_state
     file['stairs_index'] = objects.index(stairs)
     file['dungeon_level'] = dungeon_level
+    file['entities'] = entities
+    file['fire'] = fire
     file.close()
 
 def load_game():
     #open the previously saved shelve and load the game data
-    global map, objects, player, inventory, game_msgs, game_state
+    global map, objects, player, inventory, game_msgs, game_state, entities, fire, noises, stairs, dungeon_level
  
     file = shelve.open('savegame', 'r')
+    entities = file['entities']
     map = file['map']
+    fire = file['fire']
     objects = file['objects']
     player = objects[file['player_index']]  #get index of player in objects list and access it
     inventory = file['inventory']
@@ -1088,15 +2148,24 @@ def load_game():
     stairs = objects[file['stairs_index']]
     dungeon_level = file['dungeon_level'] 
     file.close()
+    noises = []
  
+    rebuild_indexes()
+    #the turn order isn't saved, so the fire has to be put back in it
+    fire.scheduled = False
+    if fire.burning:
+        fire.schedule()
     initialize_fov()	
 	
 def new_game():
-    global player, inventory, game_msgs, game_state, dungeon_level, alert_level
+    global player, inventory, game_msgs, game_state, dungeon_level, alert_level, entities
  
+    #a fresh store for every entity of this game
+    entities = EntityStore()
+
     #create object representing the player
     fighter_component = Fighter(hp=30, defense=2, power=5, xp=0, death_function=player_death)
-    player = Object(0, 0, '@', 'player', libtcod.white, blocks=True, fighter=fighter_component)
+    player = Object(0, 0, '@', 'player', libtcod.white, blocks=True, fighter=fighter_component, layer=LAYER_PLAYER)
  
     player.level = 1
 	
@@ -1109,50 +2178,76 @@ def new_game():
     game_state = 'playing'
     inventory = []
  
-    #create the list of game messages and their colors, starts empty
-    game_msgs = []
+    #create the log of game messages and their colors, starts empty
+    game_msgs = MessageLog(MSG_HISTORY)
+    pending_events.clear()
  
     #a warm welcoming message!
     message('Insert apocolypse here', libtcod.red)
 
 def initialize_fov():
-    global fov_recompute, fov_map
+    global fov_recompute, fov_map, visible_tiles, drawn_glyphs, repaint_map
     fov_recompute = True
  
     #create the FOV map, according to the generated map
     fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            libtcod.map_set_properties(fov_map, x, y, not map[x][y].block_sight, not map[x][y].blocked)
+    libtcod.map_set_properties_bulk(fov_map, MAP_WIDTH, map.transparency(), map.walkability())
 
     libtcod.console_clear(con)  #unexplored areas start black (which is the default background color)
 
+    #con is blank now, so the renderer starts from scratch
+    visible_tiles = set()
+    drawn_glyphs = {}
+    repaint_map = True
+
 def play_game():
+    global animation_frame
     player_action = None
+    redraw = True
+    next_animation = 0
+    mouse_cell = None
  
     while not libtcod.console_is_window_closed():
-        #render the screen
-        render_all()
- 
-        libtcod.console_flush()
-        check_level_up() 
-        #erase all objects at their old locations, before they move
-        for object in objects:
-            object.clear()
+        #while something is burning the screen is redrawn at most LIMIT_FPS times a second,
+        #even when nothing else happens, so the flames flicker
+        if fire.burning and libtcod.sys_elapsed_milli() >= next_animation:
+            next_animation = libtcod.sys_elapsed_milli() + 1000 / LIMIT_FPS
+            animation_frame += 1
+            redraw = True
+
+        #render the screen, but only if something changed
+        if redraw:
+            redraw = False
+            render_all()
+ 
+            libtcod.console_flush()
+            check_level_up() 
+ 
+        #wait for something to happen: a key, a click or the mouse moving to another cell.
+        #if nothing did, sleep for a moment instead of redrawing the same frame again
+        key = libtcod.console_check_for_keypress(libtcod.KEY_PRESSED)
+        mouse = libtcod.mouse_get_status()
+        if (key.vk == libtcod.KEY_NONE and not mouse.lbutton_pressed and not mouse.rbutton_pressed
+            and (mouse.cx, mouse.cy) == mouse_cell):
+            libtcod.sys_sleep_milli(IDLE_WAIT_MS)
+            continue
+        mouse_cell = (mouse.cx, mouse.cy)
+        redraw = True
  
         #handle keys and exit game if needed
-        player_action = handle_keys()
+        player_action = handle_keys(key, mouse)
         if player_action == 'exit':
             save_game()
             break
  
-        #let monsters take their turn
+        #the player's action took a turn: let everything that falls due before their next one happen
         if game_state == 'playing' and player_action != 'didnt-take-turn':
-            for object in objects:
-                if object.flame:
-                    object.flame.take_turn()
-                if object.ai:
-                    object.ai.take_turn()
+            wake_within_earshot()
+            turns.run(TURN)
+            fade_noises()
+
+        #what happened this turn goes into the log, merged
+        flush_events()
         
 def main_menu():
     # img = libtcod.image_load('menu_background.png')
@@ -1167,7 +2262,7 @@ def main_menu():
         libtcod.console_print_center(0, SCREEN_WIDTH/2, SCREEN_HEIGHT-2, libtcod.BKGND_NONE, 'By Glenn Jackson')
  
         #show options and wait for the player's choice
-        choice = menu('', ['Play a new game'], 24)
+        choice = menu('', ['Play a new game'], 24, static=True)
 
 	
         if choice == 0:  #new game
@@ -1196,9 +2291,18 @@ def main_menu():
 #Game Initilaization#
 #===================#
 
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'Zombies!', False)
-libtcod.sys_set_fps(LIMIT_FPS)
-con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
-panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
-
-main_menu()		
\ No newline at end of file
+def initialize_consoles():
+    global con, panel, animation_frame
+    #game font
+    libtcod.console_set_custom_font('arial10x10.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
+    libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'Zombies!', False)
+    libtcod.sys_set_fps(0)  #no cap on flushes, play_game only redraws when it has to
+    animation_frame = 0
+    con = libtcod.console_new(CAMERA_WIDTH, CAMERA_HEIGHT)
+    panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+
+#importing this module sets nothing up, so scripts can drive the game themselves
+#(initialize_consoles, new_game, play_game)
+if __name__ == '__main__':
+    initialize_consoles()
+    main_menu()
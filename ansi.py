@@ -0,0 +1,176 @@
+#
+# ansi terminal backend
+#
+# the headless backend (see headless.py), drawn on a terminal with ANSI escape codes and fed
+# from the keyboard and the xterm mouse, so the game can be played over ssh
+# (set ZOMBIES_BACKEND=ansi, the terminal needs to be at least 80x50).
+#
+# console_flush compares the root console with the last frame sent and only writes the cells
+# that changed. the cursor is only moved when the next changed cell isn't the one right after
+# the last cell written, and colours are only sent when they differ from the previous cell,
+# so a frame costs bytes in proportion to what changed rather than to the screen size.
+#
+
+import os
+import sys
+import time
+import select
+import atexit
+
+import headless
+from headless import *
+
+#what the terminal is showing: one (char, fore, back) per root console cell, None before the first frame
+last_frame = None
+
+#a unicode character for each libtcod character code (the font is laid out as code page 437)
+GLYPHS = [u' '] * 32 + [bytearray([c]).decode('cp437') for c in range(32, 256)]
+
+#xterm key sequences, and the numbers that move the player like the numpad does
+KEY_SEQUENCES = {
+    '\x1b[A': KEY_UP, '\x1b[B': KEY_DOWN, '\x1b[C': KEY_RIGHT, '\x1b[D': KEY_LEFT,
+    '\x1bOA': KEY_UP, '\x1bOB': KEY_DOWN, '\x1bOC': KEY_RIGHT, '\x1bOD': KEY_LEFT,
+    '\x1b[5~': KEY_PAGEUP, '\x1b[6~': KEY_PAGEDOWN,
+    '\r': KEY_ENTER, '\n': KEY_ENTER, '\x1b': KEY_ESCAPE,
+    '1': KEY_KP1, '2': KEY_KP2, '3': KEY_KP3, '4': KEY_KP4, '5': KEY_KP5,
+    '6': KEY_KP6, '7': KEY_KP7, '8': KEY_KP8, '9': KEY_KP9,
+}
+
+SETUP = '\x1b[?1049h\x1b[?25l\x1b[2J\x1b[?1003h\x1b[?1006h'  #alternate screen, hide cursor, clear, mouse on
+RESTORE = '\x1b[?1006l\x1b[?1003l\x1b[0m\x1b[?25h\x1b[?1049l'
+
+saved_tty = None
+pending = ''  #bytes read from the terminal but not parsed yet
+mouse = Mouse()
+start_time = time.time()
+
+def restore_terminal():
+    if saved_tty is not None:
+        import termios
+        termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, saved_tty)
+        os.write(sys.stdout.fileno(), RESTORE.encode('ascii'))
+
+def console_init_root(w, h, title, fs=False):
+    global saved_tty, last_frame
+    import termios
+    import tty
+    headless.console_init_root(w, h, title, fs)
+    last_frame = None
+    #no echo and no line buffering, keys arrive as they are pressed
+    saved_tty = termios.tcgetattr(sys.stdin.fileno())
+    tty.setcbreak(sys.stdin.fileno())
+    atexit.register(restore_terminal)
+    os.write(sys.stdout.fileno(), SETUP.encode('ascii'))
+
+def console_flush():
+    global last_frame
+    headless.console_flush()
+    root = headless.root
+    frame = list(zip(root.chars, root.fore, root.back))
+    if last_frame is None:
+        last_frame = [None] * len(frame)
+
+    out = []
+    cursor = None  #where the terminal cursor is, when it's known
+    colors = (None, None)
+    for (i, cell) in enumerate(frame):
+        if cell == last_frame[i]:
+            continue
+        if cursor != i:
+            out.append('\x1b[%d;%dH' % (i // root.width + 1, i % root.width + 1))
+        (char, fore, back) = cell
+        if (fore, back) != colors:
+            out.append('\x1b[38;2;%d;%d;%d;48;2;%d;%d;%dm' % (fore + back))
+            colors = (fore, back)
+        out.append(GLYPHS[char & 0xff])
+        #the cursor moves on by itself, except past the end of a line
+        cursor = i + 1 if (i + 1) % root.width else None
+    last_frame = frame
+    if out:
+        os.write(sys.stdout.fileno(), u''.join(out).encode('utf-8'))
+
+def read_input(timeout):
+    #wait up to timeout seconds for the terminal, and keep whatever it sent
+    global pending
+    fd = sys.stdin.fileno()
+    while select.select([fd], [], [], timeout)[0]:
+        data = os.read(fd, 1024)
+        if not data:
+            close_window()
+            break
+        pending += data.decode('latin-1')
+        timeout = 0
+
+def next_event():
+    #take one key or mouse event off the front of the pending input, or None if there isn't
+    #a whole one there yet. escape sequences the game has no use for are skipped
+    global pending
+    while pending:
+        if pending.startswith('\x1b[') or pending.startswith('\x1bO'):
+            if pending[1] == '[':
+                #CSI: ESC [, parameter and intermediate bytes, then one final byte from @ to ~
+                end = 2
+                while end < len(pending) and not '@' <= pending[end] <= '~':
+                    end += 1
+            else:
+                #SS3: ESC O and one more byte
+                end = 2
+            if end >= len(pending):
+                return None  #the rest hasn't arrived yet
+            sequence = pending[:end + 1]
+            pending = pending[end + 1:]
+            if sequence.startswith('\x1b[<'):
+                return mouse_event(sequence)
+            if sequence in KEY_SEQUENCES:
+                return (Key(KEY_SEQUENCES[sequence]), Mouse(mouse.cx, mouse.cy))
+            continue
+        #anything else is one key. ESC on its own (not starting a sequence) is the escape key,
+        #and whatever follows it is left for the next event
+        char = pending[0]
+        pending = pending[1:]
+        if char in KEY_SEQUENCES:
+            return (Key(KEY_SEQUENCES[char]), Mouse(mouse.cx, mouse.cy))
+        return (Key(KEY_CHAR, ord(char)), Mouse(mouse.cx, mouse.cy))
+    return None
+
+def mouse_event(sequence):
+    #SGR mouse report: ESC [ < button ; column ; row, then M for press/motion or m for release
+    (button, cx, cy) = [int(v) for v in sequence[3:-1].split(';')]
+    released = sequence[-1] == 'm'
+    moved = Mouse(cx - 1, cy - 1)
+    if not released and button & (32 | 64) == 0:  #not a motion or wheel report
+        moved.lbutton_pressed = int(button & 3 == 0)
+        moved.rbutton_pressed = int(button & 3 == 2)
+    return (Key(), moved)
+
+def console_check_for_keypress(flags=KEY_RELEASED):
+    global mouse
+    read_input(0)
+    event = next_event()
+    if event is None:
+        mouse = Mouse(mouse.cx, mouse.cy)  #clicks only last one check
+        return Key()
+    (key, mouse) = event
+    return key
+
+def console_wait_for_keypress(flush):
+    global mouse
+    while not console_is_window_closed():
+        event = next_event()
+        if event is None:
+            read_input(None)
+            continue
+        (key, mouse) = event
+        if key.vk != KEY_NONE:
+            return key
+    return Key()
+
+def mouse_get_status():
+    return mouse
+
+def sys_elapsed_milli():
+    return int((time.time() - start_time) * 1000)
+
+def sys_sleep_milli(val):
+    #wake up early if a key comes in
+    read_input(val / 1000.0)
@@ -0,0 +1,714 @@
+#
+# headless console backend
+#
+# a stand-in for libtcodpy that needs neither a window nor the native libtcod library.
+# it implements the part of the libtcodpy api the game uses, with the same names and
+# arguments, so Main.py can import it in place of libtcodpy (set ZOMBIES_BACKEND=headless).
+#
+# consoles are in-memory cell buffers, and input comes from a queue filled by the caller
+# (push_key, push_mouse) or from an input_source callback. once both run dry the window
+# counts as closed and the game loops end. sys_sleep_milli only advances a virtual clock,
+# so a scripted game runs at full speed.
+#
+
+import random as _random
+import textwrap
+
+############################
+# color module
+############################
+class Color(object):
+    __slots__ = ('r', 'g', 'b')
+
+    def __init__(self, r=0, g=0, b=0):
+        self.r = r
+        self.g = g
+        self.b = b
+
+    def __eq__(self, c):
+        return (self.r == c.r) and (self.g == c.g) and (self.b == c.b)
+
+    def __ne__(self, c):
+        return not self == c
+
+    def __hash__(self):
+        return col_to_int(self)
+
+    def __mul__(self, c):
+        if isinstance(c, Color):
+            return Color(self.r * c.r // 255, self.g * c.g // 255, self.b * c.b // 255)
+        return Color(_clamp(int(self.r * c)), _clamp(int(self.g * c)), _clamp(int(self.b * c)))
+
+    def __add__(self, c):
+        return Color(_clamp(self.r + c.r), _clamp(self.g + c.g), _clamp(self.b + c.b))
+
+    def __sub__(self, c):
+        return Color(_clamp(self.r - c.r), _clamp(self.g - c.g), _clamp(self.b - c.b))
+
+    def __getstate__(self):
+        return (self.r, self.g, self.b)
+
+    def __setstate__(self, state):
+        (self.r, self.g, self.b) = state
+
+    def __repr__(self):
+        return 'Color(%d, %d, %d)' % (self.r, self.g, self.b)
+
+def _clamp(v):
+    return max(0, min(255, v))
+
+def col_to_int(c):
+    return (int(c.r) << 16) | (c.g << 8) | c.b
+
+def int_to_col(i):
+    return Color((i & 0xFF0000) >> 16, (i & 0xFF00) >> 8, i & 0xFF)
+
+def color_lerp(c1, c2, a):
+    return Color(int(c1.r + (c2.r - c1.r) * a), int(c1.g + (c2.g - c1.g) * a), int(c1.b + (c2.b - c1.b) * a))
+
+# default colors
+# grey levels
+black=Color(0,0,0)
+darker_grey=Color(31,31,31)
+dark_grey=Color(63,63,63)
+grey=Color(128,128,128)
+light_grey=Color(191,191,191)
+darker_gray=Color(31,31,31)
+dark_gray=Color(63,63,63)
+gray=Color(128,128,128)
+light_gray=Color(191,191,191)
+white=Color(255,255,255)
+
+#standard colors
+red=Color(255,0,0)
+orange=Color(255,127,0)
+yellow=Color(255,255,0)
+chartreuse=Color(127,255,0)
+green=Color(0,255,0)
+sea=Color(0,255,127)
+cyan=Color(0,255,255)
+sky=Color(0,127,255)
+blue=Color(0,0,255)
+violet=Color(127,0,255)
+magenta=Color(255,0,255)
+pink=Color(255,0,127)
+
+# dark colors
+dark_red=Color(127,0,0)
+dark_orange=Color(127,63,0)
+dark_yellow=Color(127,127,0)
+dark_chartreuse=Color(63,127,0)
+dark_green=Color(0,127,0)
+dark_sea=Color(0,127,63)
+dark_cyan=Color(0,127,127)
+dark_sky=Color(0,63,127)
+dark_blue=Color(0,0,127)
+dark_violet=Color(63,0,127)
+dark_magenta=Color(127,0,127)
+dark_pink=Color(127,0,63)
+
+# darker colors
+darker_red=Color(63,0,0)
+darker_orange=Color(63,31,0)
+darker_yellow=Color(63,63,0)
+darker_chartreuse=Color(31,63,0)
+darker_green=Color(0,63,0)
+darker_sea=Color(0,63,31)
+darker_cyan=Color(0,63,63)
+darker_sky=Color(0,31,63)
+darker_blue=Color(0,0,63)
+darker_violet=Color(31,0,63)
+darker_magenta=Color(63,0,63)
+darker_pink=Color(63,0,31)
+
+# light colors
+light_red=Color(255,127,127)
+light_orange=Color(255,191,127)
+light_yellow=Color(255,255,127)
+light_chartreuse=Color(191,255,127)
+light_green=Color(127,255,127)
+light_sea=Color(127,255,191)
+light_cyan=Color(127,255,255)
+light_sky=Color(127,191,255)
+light_blue=Color(127,127,255)
+light_violet=Color(191,127,255)
+light_magenta=Color(255,127,255)
+light_pink=Color(255,127,191)
+
+# desaturated colors
+desaturated_red=Color(127,63,63)
+desaturated_orange=Color(127,95,63)
+desaturated_yellow=Color(127,127,63)
+desaturated_chartreuse=Color(95,127,63)
+desaturated_green=Color(63,127,63)
+desaturated_sea=Color(63,127,95)
+desaturated_cyan=Color(63,127,127)
+desaturated_sky=Color(63,95,127)
+desaturated_blue=Color(63,63,127)
+desaturated_violet=Color(95,63,127)
+desaturated_magenta=Color(127,63,127)
+desaturated_pink=Color(127,63,95)
+
+# special
+silver=Color(203,203,203)
+gold=Color(255,255,102)
+
+
+############################
+# console module
+############################
+class Key(object):
+    def __init__(self, vk=0, c=0):
+        self.vk = vk
+        self.c = c
+        self.pressed = 1 if vk else 0
+        self.lalt = 0
+        self.lctrl = 0
+        self.ralt = 0
+        self.rctrl = 0
+        self.shift = 0
+
+# background rendering modes
+BKGND_NONE = 0
+BKGND_SET = 1
+BKGND_MULTIPLY = 2
+BKGND_LIGHTEN = 3
+BKGND_DARKEN = 4
+BKGND_SCREEN = 5
+BKGND_COLOR_DODGE = 6
+BKGND_COLOR_BURN = 7
+BKGND_ADD = 8
+BKGND_ADDA = 9
+BKGND_BURN = 10
+BKGND_OVERLAY = 11
+BKGND_ALPH = 12
+
+def BKGND_ALPHA(a):
+    return BKGND_ALPH | (int(a * 255) << 8)
+
+def BKGND_ADDALPHA(a):
+    return BKGND_ADDA | (int(a * 255) << 8)
+
+# non blocking key events types
+KEY_PRESSED = 1
+KEY_RELEASED = 2
+# key codes
+KEY_NONE = 0
+KEY_ESCAPE = 1
+KEY_BACKSPACE = 2
+KEY_TAB = 3
+KEY_ENTER = 4
+KEY_SHIFT = 5
+KEY_CONTROL = 6
+KEY_ALT = 7
+KEY_PAUSE = 8
+KEY_CAPSLOCK = 9
+KEY_PAGEUP = 10
+KEY_PAGEDOWN = 11
+KEY_END = 12
+KEY_HOME = 13
+KEY_UP = 14
+KEY_LEFT = 15
+KEY_RIGHT = 16
+KEY_DOWN = 17
+KEY_PRINTSCREEN = 18
+KEY_INSERT = 19
+KEY_DELETE = 20
+KEY_LWIN = 21
+KEY_RWIN = 22
+KEY_APPS = 23
+KEY_0 = 24
+KEY_1 = 25
+KEY_2 = 26
+KEY_3 = 27
+KEY_4 = 28
+KEY_5 = 29
+KEY_6 = 30
+KEY_7 = 31
+KEY_8 = 32
+KEY_9 = 33
+KEY_KP0 = 34
+KEY_KP1 = 35
+KEY_KP2 = 36
+KEY_KP3 = 37
+KEY_KP4 = 38
+KEY_KP5 = 39
+KEY_KP6 = 40
+KEY_KP7 = 41
+KEY_KP8 = 42
+KEY_KP9 = 43
+KEY_KPADD = 44
+KEY_KPSUB = 45
+KEY_KPDIV = 46
+KEY_KPMUL = 47
+KEY_KPDEC = 48
+KEY_KPENTER = 49
+KEY_F1 = 50
+KEY_F2 = 51
+KEY_F3 = 52
+KEY_F4 = 53
+KEY_F5 = 54
+KEY_F6 = 55
+KEY_F7 = 56
+KEY_F8 = 57
+KEY_F9 = 58
+KEY_F10 = 59
+KEY_F11 = 60
+KEY_F12 = 61
+KEY_NUMLOCK = 62
+KEY_SCROLLLOCK = 63
+KEY_SPACE = 64
+KEY_CHAR = 65
+
+# font flags (accepted and ignored, there is no font to load)
+FONT_LAYOUT_ASCII_INCOL = 1
+FONT_LAYOUT_ASCII_INROW = 2
+FONT_TYPE_GREYSCALE = 4
+FONT_TYPE_GRAYSCALE = 4
+FONT_LAYOUT_TCOD = 8
+
+#size of a cell in pixels, for the mouse's pixel coordinates
+CELL_WIDTH = 10
+CELL_HEIGHT = 10
+
+class Console(object):
+    #one cell per index (x + y * width): a character code, a foreground and a background colour.
+    #colours are kept as (r, g, b) tuples
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.fore_color = (255, 255, 255)
+        self.back_color = (0, 0, 0)
+        self.clear()
+
+    def clear(self):
+        size = self.width * self.height
+        self.chars = [ord(' ')] * size
+        self.fore = [self.fore_color] * size
+        self.back = [self.back_color] * size
+
+    def contains(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def row_text(self, y):
+        #the characters on one line, handy for checking what was printed
+        return ''.join(chr(c) if 32 <= c < 127 else ' ' for c in self.chars[y * self.width:(y + 1) * self.width])
+
+root = None
+fullscreen = False
+window_closed = False
+frames = 0  #number of console_flush calls
+
+def _console(con):
+    #0 stands for the root console, as in libtcod
+    if con == 0:
+        return root
+    return con
+
+def _tuple(col):
+    return (col.r, col.g, col.b)
+
+def _blend(old, new, flag):
+    mode = flag & 0xff
+    alpha = (flag >> 8) / 255.0
+    if mode == BKGND_NONE:
+        return old
+    if mode == BKGND_SET:
+        return new
+    if mode == BKGND_MULTIPLY:
+        return tuple(o * n // 255 for (o, n) in zip(old, new))
+    if mode == BKGND_LIGHTEN:
+        return tuple(max(o, n) for (o, n) in zip(old, new))
+    if mode == BKGND_DARKEN:
+        return tuple(min(o, n) for (o, n) in zip(old, new))
+    if mode == BKGND_SCREEN:
+        return tuple(255 - (255 - o) * (255 - n) // 255 for (o, n) in zip(old, new))
+    if mode == BKGND_ADD:
+        return tuple(min(255, o + n) for (o, n) in zip(old, new))
+    if mode == BKGND_ADDA:
+        return tuple(min(255, int(o + alpha * n)) for (o, n) in zip(old, new))
+    if mode == BKGND_ALPH:
+        return tuple(int(o + alpha * (n - o)) for (o, n) in zip(old, new))
+    #the remaining modes are rarely used, treat them as a plain set
+    return new
+
+def console_set_custom_font(fontFile, flags=FONT_LAYOUT_ASCII_INCOL, nb_char_horiz=0, nb_char_vertic=0):
+    pass
+
+def console_init_root(w, h, title, fs=False):
+    global root, window_closed, fullscreen
+    root = Console(w, h)
+    window_closed = False
+    fullscreen = bool(fs)
+
+def console_get_width(con):
+    return _console(con).width
+
+def console_get_height(con):
+    return _console(con).height
+
+def console_set_fullscreen(fs):
+    global fullscreen
+    fullscreen = bool(fs)
+
+def console_is_fullscreen():
+    return fullscreen
+
+def console_is_window_closed():
+    return window_closed
+
+def console_new(w, h):
+    return Console(w, h)
+
+def console_delete(con):
+    pass
+
+def console_flush():
+    global frames
+    frames += 1
+
+def console_set_foreground_color(con, col):
+    _console(con).fore_color = _tuple(col)
+
+def console_set_background_color(con, col):
+    _console(con).back_color = _tuple(col)
+
+def console_clear(con):
+    _console(con).clear()
+
+def console_put_char(con, x, y, c, flag=BKGND_SET):
+    con = _console(con)
+    if not con.contains(x, y):
+        return
+    i = x + y * con.width
+    if isinstance(c, str):
+        c = ord(c)
+    con.chars[i] = c
+    con.fore[i] = con.fore_color
+    con.back[i] = _blend(con.back[i], con.back_color, flag)
+
+def console_set_back(con, x, y, col, flag=BKGND_SET):
+    con = _console(con)
+    if con.contains(x, y):
+        i = x + y * con.width
+        con.back[i] = _blend(con.back[i], _tuple(col), flag)
+
+def console_set_fore(con, x, y, col):
+    con = _console(con)
+    if con.contains(x, y):
+        con.fore[x + y * con.width] = _tuple(col)
+
+def console_set_char(con, x, y, c):
+    con = _console(con)
+    if con.contains(x, y):
+        if isinstance(c, str):
+            c = ord(c)
+        con.chars[x + y * con.width] = c
+
+def console_get_back(con, x, y):
+    con = _console(con)
+    return Color(*con.back[x + y * con.width])
+
+def console_get_fore(con, x, y):
+    con = _console(con)
+    return Color(*con.fore[x + y * con.width])
+
+def console_get_char(con, x, y):
+    con = _console(con)
+    return con.chars[x + y * con.width]
+
+def console_rect(con, x, y, w, h, clr, flag=BKGND_SET):
+    con = _console(con)
+    for cy in range(max(0, y), min(con.height, y + h)):
+        for cx in range(max(0, x), min(con.width, x + w)):
+            i = cx + cy * con.width
+            con.back[i] = _blend(con.back[i], con.back_color, flag)
+            if clr:
+                con.chars[i] = ord(' ')
+
+def console_fill_background(con, r, g, b):
+    #r, g and b are lists (or NumPy arrays) covering the whole console, row by row
+    con = _console(con)
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+    if hasattr(r, 'tolist'):
+        (r, g, b) = (r.tolist(), g.tolist(), b.tolist())
+    con.back[:len(r)] = zip(r, g, b)
+
+def _print(con, x, y, flag, s):
+    for (i, c) in enumerate(s):
+        console_put_char(con, x + i, y, ord(c), flag)
+
+def _wrap(s, w):
+    #split the text the way libtcod does: at newlines, then at spaces to fit the width
+    lines = []
+    for paragraph in s.split('\n'):
+        lines.extend(textwrap.wrap(paragraph, w) or [''])
+    return lines
+
+def console_print_left(con, x, y, bk, s):
+    _print(con, x, y, bk, s)
+
+def console_print_right(con, x, y, bk, s):
+    _print(con, x - len(s) + 1, y, bk, s)
+
+def console_print_center(con, x, y, bk, s):
+    _print(con, x - len(s) // 2, y, bk, s)
+
+def console_print_left_rect(con, x, y, w, h, bk, s):
+    lines = _wrap(s, w)
+    if h > 0:
+        lines = lines[:h]
+    for (i, line) in enumerate(lines):
+        _print(con, x, y + i, bk, line)
+    return len(lines)
+
+def console_height_left_rect(con, x, y, w, h, s):
+    lines = len(_wrap(s, w))
+    if h > 0:
+        lines = min(lines, h)
+    return lines
+
+def console_blit(src, x, y, w, h, dst, xdst, ydst, ffade=1.0, bfade=1.0):
+    src = _console(src)
+    dst = _console(dst)
+    if w == 0:
+        w = src.width
+    if h == 0:
+        h = src.height
+    #clip the rectangle to both consoles
+    if x < 0:
+        (w, xdst, x) = (w + x, xdst - x, 0)
+    if y < 0:
+        (h, ydst, y) = (h + y, ydst - y, 0)
+    if xdst < 0:
+        (w, x, xdst) = (w + xdst, x - xdst, 0)
+    if ydst < 0:
+        (h, y, ydst) = (h + ydst, y - ydst, 0)
+    w = min(w, src.width - x, dst.width - xdst)
+    h = min(h, src.height - y, dst.height - ydst)
+    if w <= 0 or h <= 0:
+        return
+    for cy in range(h):
+        s = x + (y + cy) * src.width
+        d = xdst + (ydst + cy) * dst.width
+        if ffade == 1.0 and bfade == 1.0:
+            #a plain copy, a row at a time
+            dst.chars[d:d + w] = src.chars[s:s + w]
+            dst.fore[d:d + w] = src.fore[s:s + w]
+            dst.back[d:d + w] = src.back[s:s + w]
+            continue
+        for i in range(w):
+            #faded blit: the background shows through, and so do the characters behind blank cells
+            back = _lerp(dst.back[d + i], src.back[s + i], bfade)
+            if src.chars[s + i] == ord(' '):
+                dst.fore[d + i] = _lerp(dst.fore[d + i], src.back[s + i], bfade)
+            else:
+                dst.chars[d + i] = src.chars[s + i]
+                dst.fore[d + i] = _lerp(dst.fore[d + i], src.fore[s + i], ffade)
+            dst.back[d + i] = back
+
+def _lerp(a, b, t):
+    return tuple(int(p + (q - p) * t) for (p, q) in zip(a, b))
+
+############################
+# input
+############################
+class Mouse(object):
+    def __init__(self, cx=0, cy=0):
+        self.x = cx * CELL_WIDTH
+        self.y = cy * CELL_HEIGHT
+        self.dx = 0
+        self.dy = 0
+        self.cx = cx
+        self.cy = cy
+        self.dcx = 0
+        self.dcy = 0
+        self.lbutton = 0
+        self.rbutton = 0
+        self.mbutton = 0
+        self.lbutton_pressed = 0
+        self.rbutton_pressed = 0
+        self.mbutton_pressed = 0
+        self.wheel_up = 0
+        self.wheel_down = 0
+
+#scripted input: a queue of (key, mouse) events, one taken per keyboard check.
+#when it is empty, input_source (if set) is called for the next event; a None from it,
+#or no input_source at all, closes the window
+input_queue = []
+input_source = None
+mouse = Mouse()
+
+def push_key(key, shift=False):
+    #a key code (KEY_ESCAPE, KEY_KP8...) or a one-letter string for a character key
+    if isinstance(key, str):
+        k = Key(KEY_CHAR, ord(key))
+    else:
+        k = Key(key)
+    k.shift = int(shift)
+    input_queue.append((k, Mouse(mouse.cx, mouse.cy)))
+
+def push_mouse(cx, cy, lbutton=False, rbutton=False):
+    #move the mouse to a cell, optionally clicking there
+    m = Mouse(cx, cy)
+    m.lbutton_pressed = int(lbutton)
+    m.rbutton_pressed = int(rbutton)
+    input_queue.append((Key(), m))
+
+def close_window():
+    global window_closed
+    window_closed = True
+
+def _next_event():
+    global mouse
+    if window_closed:
+        return Key()
+    if input_queue:
+        (key, mouse) = input_queue.pop(0)
+        return key
+    event = input_source() if input_source is not None else None
+    if event is None:
+        close_window()
+        mouse = Mouse(mouse.cx, mouse.cy)
+        return Key()
+    (key, mouse) = event
+    return key
+
+def console_check_for_keypress(flags=KEY_RELEASED):
+    return _next_event()
+
+def console_wait_for_keypress(flush):
+    #skip mouse-only events, as a real keyboard wait would
+    while not window_closed:
+        key = _next_event()
+        if key.vk != KEY_NONE:
+            return key
+    return Key()
+
+def mouse_get_status():
+    return mouse
+
+############################
+# system
+############################
+clock_ms = 0  #virtual time, moved forward by sys_sleep_milli
+
+def sys_set_fps(val):
+    pass
+
+def sys_get_fps():
+    return 0
+
+def sys_elapsed_milli():
+    return clock_ms
+
+def sys_elapsed_seconds():
+    return clock_ms / 1000.0
+
+def sys_sleep_milli(val):
+    global clock_ms
+    clock_ms += val
+
+############################
+# random
+############################
+generator = _random.Random()
+
+def random_set_seed(seed):
+    generator.seed(seed)
+
+def random_get_int(rnd, mi, ma):
+    return generator.randint(mi, ma)
+
+def random_get_float(rnd, mi, ma):
+    return generator.uniform(mi, ma)
+
+############################
+# fov module
+############################
+FOV_BASIC = 0
+
+class Map(object):
+    def __init__(self, w, h):
+        self.width = w
+        self.height = h
+        self.transparent = bytearray(w * h)
+        self.walkable = bytearray(w * h)
+        self.fov = bytearray(w * h)
+        self.lit = []  #indexes of the cells set in fov
+
+def map_new(w, h):
+    return Map(w, h)
+
+def map_clear(m):
+    m.transparent = bytearray(m.width * m.height)
+    m.walkable = bytearray(m.width * m.height)
+
+def map_set_properties(m, x, y, isTrans, isWalk):
+    i = x + y * m.width
+    m.transparent[i] = 1 if isTrans else 0
+    m.walkable[i] = 1 if isWalk else 0
+
+def map_set_properties_bulk(m, w, transparent, walkable):
+    m.transparent = bytearray(1 if t else 0 for t in transparent)
+    m.walkable = bytearray(1 if k else 0 for k in walkable)
+
+def map_is_transparent(m, x, y):
+    return m.transparent[x + y * m.width] == 1
+
+def map_is_walkable(m, x, y):
+    return m.walkable[x + y * m.width] == 1
+
+def map_compute_fov(m, x, y, radius=0, light_walls=True, algo=FOV_BASIC):
+    #basic ray casting, whatever algo is asked for: a ray goes from the origin to every
+    #cell on the edge of the radius square, and stops at the first cell that blocks sight
+    #only the cells lit last time need clearing, so a big map costs no more than a small one
+    for i in m.lit:
+        m.fov[i] = 0
+    m.lit = []
+    if radius > 0:
+        (x1, y1, x2, y2) = (x - radius, y - radius, x + radius, y + radius)
+    else:
+        (x1, y1, x2, y2) = (0, 0, m.width - 1, m.height - 1)
+    r2 = radius * radius
+    m.fov[x + y * m.width] = 1
+    m.lit.append(x + y * m.width)
+    edge = ([(ex, y1) for ex in range(x1, x2 + 1)] + [(ex, y2) for ex in range(x1, x2 + 1)] +
+        [(x1, ey) for ey in range(y1 + 1, y2)] + [(x2, ey) for ey in range(y1 + 1, y2)])
+    for (ex, ey) in edge:
+        _cast_ray(m, x, y, ex, ey, r2, light_walls)
+
+def _cast_ray(m, x0, y0, x1, y1, r2, light_walls):
+    #bresenham from the origin towards (x1, y1)
+    (dx, dy) = (abs(x1 - x0), -abs(y1 - y0))
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    err = dx + dy
+    (x, y) = (x0, y0)
+    while (x, y) != (x1, y1):
+        e2 = 2 * err
+        if e2 >= dy:
+            err += dy
+            x += sx
+        if e2 <= dx:
+            err += dx
+            y += sy
+        if not (0 <= x < m.width and 0 <= y < m.height):
+            return
+        if r2 and (x - x0) ** 2 + (y - y0) ** 2 > r2:
+            return
+        i = x + y * m.width
+        if not m.fov[i] and (light_walls or m.transparent[i]):
+            m.fov[i] = 1
+            m.lit.append(i)
+        if not m.transparent[i]:
+            return
+
+def map_is_in_fov(m, x, y):
+    if not (0 <= x < m.width and 0 <= y < m.height):
+        return False
+    return m.fov[x + y * m.width] == 1
+
+def map_delete(m):
+    pass
@@ -1142,6 +1142,39 @@ def map_copy(source, dest):
 def map_set_properties(m, x, y, isTrans, isWalk):
     _lib.TCOD_map_set_properties(m, x, y, c_int(isTrans), c_int(isWalk))
 
+# the layout of a map in libtcod 1.5: a header, then one byte per cell, row by row,
+# holding bit fields: transparent in bit 0, walkable in bit 1, fov in bit 2
+class _CMap(Structure):
+    _fields_ = [('width', c_int),
+                ('height', c_int),
+                ('nbcells', c_int),
+                ('cells', c_void_p),
+                ]
+
+_ONE_IF_SET = bytes(bytearray([0] + [1] * 255))
+_TWO_IF_SET = bytes(bytearray([0] + [2] * 255))
+
+# load a whole map at once from two buffers (anything indexable giving one
+# value per cell, row by row: index x + y * w), e.g. bytearrays.
+# the C library has no bulk setter, so the cell bytes are built here and copied
+# over the map's own in one memmove. the two planes are added together as big
+# integers (one byte per cell, which can't carry into the next as a cell is at
+# most 3), so nothing is done per cell in Python either.
+def map_set_properties_bulk(m, w, transparent, walkable):
+    if len(transparent) != len(walkable):
+        raise TypeError('transparent and walkable must have the same size.')
+    cmap = cast(c_void_p(m), POINTER(_CMap)).contents
+    size = len(transparent)
+    if size != cmap.nbcells or w != cmap.width:
+        raise TypeError('transparent and walkable must have one value per cell of the map.')
+    if size == 0:
+        return
+    trans = bytes(bytearray(transparent).translate(_ONE_IF_SET))
+    walk = bytes(bytearray(walkable).translate(_TWO_IF_SET))
+    cells = int(trans.encode('hex'), 16) + int(walk.encode('hex'), 16)
+    cells = ('%0*x' % (size * 2, cells)).decode('hex')
+    memmove(cmap.cells, cells, size)
+
 def map_clear(m):
     _lib.TCOD_map_clear(m)
 
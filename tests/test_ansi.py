@@ -0,0 +1,46 @@
+#
+# the ansi backend's input parsing, for keys that arrive bunched together
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ansi
+
+def events(data):
+    #every whole event in data, as (key code, character) or ('mouse', x, y, clicked), and what's left over
+    ansi.pending = data
+    found = []
+    while True:
+        event = ansi.next_event()
+        if event is None:
+            return (found, ansi.pending)
+        (key, mouse) = event
+        if key.vk == ansi.KEY_NONE:
+            found.append(('mouse', mouse.cx, mouse.cy, mouse.lbutton_pressed))
+        else:
+            found.append((key.vk, chr(key.c) if key.c else ''))
+
+class NextEventTest(unittest.TestCase):
+    def test_escape_followed_by_keys(self):
+        self.assertEqual(events('\x1ba'), ([(ansi.KEY_ESCAPE, ''), (ansi.KEY_CHAR, 'a')], ''))
+        self.assertEqual(events('\x1b66'), ([(ansi.KEY_ESCAPE, ''), (ansi.KEY_KP6, ''), (ansi.KEY_KP6, '')], ''))
+        self.assertEqual(events('\x1b'), ([(ansi.KEY_ESCAPE, '')], ''))
+
+    def test_sequences(self):
+        self.assertEqual(events('\x1b[A\x1bOB\x1b[5~'), ([(ansi.KEY_UP, ''), (ansi.KEY_DOWN, ''), (ansi.KEY_PAGEUP, '')], ''))
+        #ctrl+up isn't used: it's skipped whole, and the key after it still counts
+        self.assertEqual(events('\x1b[1;5A8'), ([(ansi.KEY_KP8, '')], ''))
+
+    def test_mouse(self):
+        self.assertEqual(events('\x1b[<0;10;5M\x1b[<0;10;5mq'),
+            ([('mouse', 9, 4, 1), ('mouse', 9, 4, 0), (ansi.KEY_CHAR, 'q')], ''))
+
+    def test_unfinished_sequence_waits(self):
+        self.assertEqual(events('4\x1b[<0;1'), ([(ansi.KEY_KP4, '')], '\x1b[<0;1'))
+
+if __name__ == '__main__':
+    unittest.main()
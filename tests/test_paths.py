@@ -0,0 +1,51 @@
+#
+# the path cache: a changed tile drops exactly the cached paths through it
+#
+
+import os
+import sys
+import random
+import unittest
+
+os.environ['ZOMBIES_BACKEND'] = 'headless'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import headless
+import Main
+
+Main.initialize_consoles()
+
+class PathCacheTest(unittest.TestCase):
+    def setUp(self):
+        headless.random_set_seed(2)
+        Main.new_game()
+        self.cache = Main.paths()
+        tiles = Main.map
+        floors = [(x, y) for y in range(tiles.height) for x in range(tiles.width) if not tiles.blocked_at(x, y)]
+        rng = random.Random(2)
+        for i in range(60):
+            self.cache.find(rng.choice(floors), rng.choice(floors))
+
+    def test_blocking_a_tile_drops_the_paths_through_it(self):
+        #the floor tile the most cached paths cross
+        tile = max(self.cache.crossing, key=lambda tile: len(self.cache.crossing[tile]))
+        before = dict(self.cache.routes)
+        through = set(route for (route, (path, i)) in before.items() if tile in path)
+        self.assertTrue(through)
+        self.assertTrue(len(through) < len(before))
+
+        Main.map.set_tile(tile[0], tile[1], True)
+        self.assertEqual(set(before) - set(self.cache.routes), through)
+        for (route, (path, i)) in self.cache.routes.items():
+            self.assertNotIn(tile, path)
+        self.assertNotIn(tile, self.cache.crossing)
+
+        #a path asked for again goes round the new wall
+        (start, goal) = sorted(through)[0]
+        if start != tile:
+            steps = self.cache.find(start, goal)
+            if steps is not None:
+                self.assertNotIn(tile, steps)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#
+# smoke test: plays a short scripted game on the headless backend
+# (run with: python -m unittest discover tests)
+#
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+os.environ['ZOMBIES_BACKEND'] = 'headless'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import headless
+import Main
+
+Main.initialize_consoles()
+
+def key(code):
+    #a key code (KEY_KP6...) or a one-letter string for a character key
+    if isinstance(code, str):
+        return (headless.Key(headless.KEY_CHAR, ord(code)), headless.Mouse())
+    return (headless.Key(code), headless.Mouse())
+
+def click_near_player():
+    #left-click the nearest tile in view that isn't the player's own
+    p = Main.player
+    tiles = sorted(Main.visible_tiles - set([(p.x, p.y)]),
+        key=lambda (x, y): ((x - p.x) ** 2 + (y - p.y) ** 2, x, y))
+    (x, y) = Main.to_screen(*tiles[0])
+    mouse = headless.Mouse(x, y)
+    mouse.lbutton_pressed = 1
+    return (headless.Key(), mouse)
+
+def play(*steps):
+    #run play_game on a script: each step is an event, or a function giving one when its turn comes
+    script = iter(steps)
+    def source():
+        step = next(script, None)
+        return step() if callable(step) else step
+    headless.window_closed = False
+    del headless.input_queue[:]
+    headless.input_source = source
+    Main.play_game()
+
+MOVES = [key(headless.KEY_KP6), key(headless.KEY_KP2), key(headless.KEY_KP4), key(headless.KEY_KP8)]
+QUIT = [key(headless.KEY_ESCAPE), key('a')]  #escape, then "yes" to quit (saves the game)
+
+class SmokeTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)  #the savegame goes here
+        headless.random_set_seed(1)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def assertIndexesMatch(self):
+        #the occupancy index holds exactly the objects on the map, each under its own tile
+        indexed = []
+        for (tile, found) in Main.occupancy.items():
+            for object in found:
+                self.assertEqual((object.x, object.y), tile)
+                indexed.append(object)
+        self.assertEqual(sorted(map(id, indexed)), sorted(map(id, Main.objects)))
+
+    def test_play_save_and_load(self):
+        Main.new_game()
+        for (name, use) in (('Hand Gernade', Main.throw_gernade), ('Molotov', Main.throw_molotov)):
+            item = Main.Object(0, 0, '#', name, headless.white, item=Main.Item(use_function=use))
+            Main.inventory.insert(0, item)
+
+        #walk about, throw the molotov and the gernade (each the first thing in the inventory), quit
+        play(*(MOVES + [key('i'), key('a'), click_near_player] + MOVES +
+            [key('i'), key('a'), click_near_player] + MOVES + QUIT))
+        self.assertEqual(Main.inventory, [])
+        self.assertTrue(any(text.startswith('The gernade explodes') for (text, color, wrapped) in Main.game_msgs.messages))
+        self.assertIndexesMatch()
+        saved = sorted((object.name, object.x, object.y) for object in Main.objects)
+
+        Main.load_game()
+        self.assertEqual(sorted((object.name, object.x, object.y) for object in Main.objects), saved)
+        self.assertIn(Main.player, Main.objects)
+        self.assertIndexesMatch()
+
+        #and the loaded game plays on
+        play(*(MOVES + QUIT))
+        self.assertIndexesMatch()
+
+if __name__ == '__main__':
+    unittest.main()